@@ -1,9 +1,12 @@
 import os
 import json
-import requests
+import argparse
+import hashlib
 import re
+from utils import fetch
 from utils.rlprint import rlprint
 from utils.deconstruct import alph_only
+from utils.align import align_sequences, conflict_spans
 
 
 def clean_text(text):
@@ -13,11 +16,10 @@ def clean_text(text):
     return ' '.join(no_punc.split())
 
 
-def get_from_sefaria(name):
-    length = requests.get('http://www.sefaria.org/api/texts/' + name + '.2')
-    length = json.loads(json.dumps(length.json()))['length']
-    all_data = requests.get('http://www.sefaria.org/api/texts/' + name + '.2-' + str(length))
-    original = json.loads(json.dumps(all_data.json()))['he']
+def get_from_sefaria(name, max_age=None):
+    # max_age: see fetch.fetch; 0 downloads the text again even if it is cached
+    length = fetch.get_json('http://www.sefaria.org/api/texts/' + name + '.2', max_age)['length']
+    original = fetch.get_json('http://www.sefaria.org/api/texts/' + name + '.2-' + str(length), max_age)['he']
 
     structured = []
     for p in original:
@@ -36,54 +38,201 @@ def all_words(lines):
     return text
 
 
-def align_texts(mal, has, sef):
+def align_texts(mal, has, sef, conflicts=None, first_page=0, first_dicta=0):
+    """
+    Aligns the words of the Sefaria text with the words of the Dicta text without any human input.
+    Sefaria words without a Dicta counterpart are stored as [word, '', ''], Dicta words without a Sefaria
+    counterpart as ['', maleh, haser], in the chunk of the following Sefaria word (or at the end of the last
+    chunk, if no Sefaria word follows).
+
+    :param mal: Dicta maleh words
+    :param has: Dicta haser words
+    :param sef: Sefaria text, structured as pages of chunks of words
+    :param conflicts: if given, the low-confidence spans of the alignment are appended to this list
+    :param first_page: index in the tractate of sef[0], for reporting conflicts
+    :param first_dicta: index in the tractate of mal[0], for reporting conflicts
+    :return: the aligned text, structured as pages of chunks of [sefaria, maleh, haser] words
+    """
+    positions = [(p, c, w) for p in range(len(sef)) for c in range(len(sef[p])) for w in range(len(sef[p][c]))]
+    sef_keys = [alph_only(sef[p][c][w]) for p, c, w in positions]
+    dicta_keys = [alph_only(word) for word in mal]
+
+    alignment = align_sequences(sef_keys, dicta_keys)
+
+    aligned_text = [[[] for _ in page] for page in sef]
+    dicta_only = []
+    for i, j in alignment:
+        if i is None:
+            dicta_only.append(['', mal[j], has[j]])
+            continue
+        p, c, w = positions[i]
+        aligned_text[p][c] += dicta_only
+        dicta_only = []
+        aligned_text[p][c].append([sef[p][c][w], mal[j], has[j]] if j is not None else [sef[p][c][w], '', ''])
+    if len(dicta_only) > 0 and len(positions) > 0:
+        p, c, _ = positions[-1]
+        aligned_text[p][c] += dicta_only
+
+    if conflicts is not None:
+        for start, end in conflict_spans(sef_keys, dicta_keys, alignment):
+            span = alignment[start:end]
+            # The span is placed at its first Sefaria word, or at the Sefaria word following it
+            placed_at = next((i for i, _ in alignment[start:] if i is not None), len(positions) - 1)
+            p, c, w = positions[placed_at] if positions else (0, 0, 0)
+            conflicts.append({'page': page_label(first_page + p),
+                              'chunk': c + 1,
+                              'word': w,
+                              'dicta_index': next((first_dicta + j for _, j in span if j is not None), None),
+                              'alignment': [[sef[positions[i][0]][positions[i][1]][positions[i][2]]
+                                             if i is not None else '',
+                                             mal[j] if j is not None else ''] for i, j in span]})
+
+    return aligned_text
+
+
+def page_hash(page):
+    """
+    Hashes the Sefaria words of a page, given either as chunks of words or as chunks of aligned words.
+    Empty words are ignored, since they do not survive alignment unambiguously.
+    """
+    chunks = [[w[0] if type(w) == list else w for w in chunk] for chunk in page]
+    text = '\n'.join(' '.join(w for w in chunk if w != '') for chunk in chunks)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def unlabel_pages(labeled):
+    """
+    Inverse of tag_page and label_pages: recovers the aligned text, structured as pages of chunks of words.
+    """
+    aligned = []
+    for p in labeled:
+        chunks = [chunk['text'] for chunk in p['content']]
+        # Special case of Nazir 33b (see tag_page)
+        aligned.append([] if chunks == [[]] else chunks)
+    return aligned
+
+
+def realign_changed_pages(mal, has, sef, previous, conflicts=None):
+    """
+    Re-aligns only the pages whose Sefaria text changed since the previous alignment. The Dicta index is
+    resynced at the boundaries of every run of changed pages, from the Dicta words used by the unchanged
+    pages around it, and the new alignment is spliced in.
+
+    :param previous: the previous aligned text, structured as pages of chunks of aligned words
+    :return: the aligned text and the indices of the re-aligned pages, or None if the previous alignment
+             cannot be reused (i.e. the number of pages changed)
+    """
+    if len(previous) != len(sef):
+        return None
+
+    # dicta_start[p] = index of the first Dicta word aligned in page p
+    dicta_start = [0]
+    for page in previous:
+        dicta_start.append(dicta_start[-1] + sum(1 for chunk in page for w in chunk if w[1] != ''))
+
+    changed = [p for p in range(len(sef)) if page_hash(sef[p]) != page_hash(previous[p])]
+
+    aligned = list(previous)
+    run_start = 0
+    while run_start < len(changed):
+        run_end = run_start
+        while run_end + 1 < len(changed) and changed[run_end + 1] == changed[run_end] + 1:
+            run_end += 1
+        first, last = changed[run_start], changed[run_end]
+
+        # Dicta words left over at the end of the tractate belong to the last page (see align_texts)
+        dicta_from = dicta_start[first]
+        dicta_to = dicta_start[last + 1] if last + 1 < len(sef) else len(mal)
+        aligned[first:last + 1] = align_texts(mal[dicta_from:dicta_to], has[dicta_from:dicta_to],
+                                              sef[first:last + 1], conflicts, first, dicta_from)
+        run_start = run_end + 1
+
+    return aligned, changed
+
+
+def load_journal(journal_path):
+    """
+    Reads the decisions recorded by earlier runs of the manual aligner.
+
+    :return: dict from (tractate, page, chunk, word index, dicta index) to 'a', 's' or 'd'
+    """
+    decisions = {}
+    if not os.path.exists(journal_path):
+        return decisions
+    with open(journal_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:    # A line cut off by a crash
+                continue
+            decisions[tuple(entry['key'])] = entry['decision']
+    return decisions
+
+
+def align_texts_manually(mal, has, sef, name='', journal_path=None):
+    """
+    Aligns the words of the Sefaria text with the words of the Dicta text, asking for a decision at every
+    mismatch. If a journal is given, every decision is appended to it as soon as it is made, and decisions
+    already in it are replayed instead of asked again.
+    """
+    journal = load_journal(journal_path) if journal_path is not None else {}
+    journal_file = open(journal_path, 'a', encoding='utf-8') if journal_path is not None else None
 
     aligned_text = []
     dicta_index = 0
     p = 0
 
     while p < len(sef):
+        print(page_label(p))
         aligned_text.append([])
         c = 0
         while c < len(sef[p]):
             aligned_text[p].append([])
             w = 0
             while w < len(sef[p][c]):
-                print(str(p) + ' ' + str(c) + ' ' + str(w))
-
                 if dicta_index >= len(mal):
                     aligned_text[p][c].append([sef[p][c][w], '', ''])
                     w += 1
                     continue
 
                 if alph_only(sef[p][c][w]) == alph_only(mal[dicta_index]):
-                    aligned_text[p][c].append([sef[p][c][w], maleh[dicta_index], has[dicta_index]])
+                    aligned_text[p][c].append([sef[p][c][w], mal[dicta_index], has[dicta_index]])
                     dicta_index += 1; w += 1
 
                 else:
-                    print('Sefaria:', end='\t')
-                    rlprint(sef[p][c][w])
-                    rlprint(' '.join(sef[p][c][w-3:w+3]), end='\n')
-                    print('Dicta:', end='\t')
-                    rlprint(mal[dicta_index])
-                    rlprint(' '.join(mal[dicta_index-3:dicta_index+3]), end='\n')
+                    key = (name, page_label(p), c + 1, w, dicta_index)
+                    opt = journal.get(key, '')
+
+                    if opt == '':
+                        print('Sefaria:', end='\t')
+                        rlprint(sef[p][c][w])
+                        rlprint(' '.join(sef[p][c][w-3:w+3]), end='\n')
+                        print('Dicta:', end='\t')
+                        rlprint(mal[dicta_index])
+                        rlprint(' '.join(mal[dicta_index-3:dicta_index+3]), end='\n')
+
+                        while opt != 'a' and opt != 's' and opt != 'd':
+                            opt = input('Align (a), skip Sefaria word (s), skip Dicta word (d): ')
 
-                    opt = ''
-                    while opt != 'a' and opt != 's' and opt != 'd':
-                        opt = input('Align (a), skip Sefaria word (s), skip Dicta word (d): ')
+                        if journal_file is not None:
+                            journal_file.write(json.dumps({'key': key, 'decision': opt}, ensure_ascii=False) + '\n')
+                            journal_file.flush()
 
                     if opt == 'a':
-                        aligned_text[p][c].append([sef[p][c][w], maleh[dicta_index], has[dicta_index]])
+                        aligned_text[p][c].append([sef[p][c][w], mal[dicta_index], has[dicta_index]])
                         dicta_index += 1; w += 1
                     elif opt == 's':
                         aligned_text[p][c].append([sef[p][c][w], '', ''])
                         w += 1
                     elif opt == 'd':
-                        aligned_text[p][c].append(['', maleh[dicta_index], haser[dicta_index]])
+                        aligned_text[p][c].append(['', mal[dicta_index], has[dicta_index]])
                         dicta_index += 1
             c += 1
         p += 1
 
+    if journal_file is not None:
+        journal_file.close()
+
     return aligned_text
 
 
@@ -123,29 +272,41 @@ def tag_page(page, prev):
     return tagged_page
 
 
+def page_label(index):
+    # Tractates start on page 2a
+    return str(index // 2 + 2) + ('a' if index % 2 == 0 else 'b')
+
+
 def label_pages(mas):
-    num = 2
-    amud = 'a'
     for p in range(len(mas)):
-        mas[p] = {'page': str(num) + amud, 'content': mas[p]}
-        if amud == 'a':
-            amud = 'b'
-        else:
-            amud = 'a'
-            num += 1
+        mas[p] = {'page': page_label(p), 'content': mas[p]}
     return mas
 
 
 path = './data/dicta_talmud/'
+aligned_path = './data/aligned_talmud/'
+conflicts_path = './data/alignment_conflicts/'
+journal_path = './data/alignment_journal/'
 dirs = os.listdir(path)
 
 
 if __name__ == '__main__':
-
-    for dir in dirs:
-        do_masekhet = input('Proceed with ' + dir + '? y/n: ')
-        if do_masekhet == 'n':
-            continue
+    parser = argparse.ArgumentParser(description='Aligns the Dicta and Sefaria texts of each tractate.')
+    parser.add_argument('tractates', nargs='*', default=dirs,
+                        help='tractates to align (default: every tractate in ' + path + ')')
+    parser.add_argument('--interactive', action='store_true',
+                        help='ask for a decision at every mismatch instead of aligning automatically')
+    parser.add_argument('--incremental', action='store_true',
+                        help='download the Sefaria texts again and only re-align the pages that changed since the '
+                             'previous alignment')
+    args = parser.parse_args()
+
+    for dir in args.tractates:
+        if args.interactive:
+            do_masekhet = input('Proceed with ' + dir + '? y/n: ')
+            if do_masekhet == 'n':
+                continue
+        print(dir)
 
         files = os.listdir(path + dir)
         maleh_loc = 1*('maleh' in files[1])
@@ -155,9 +316,39 @@ if __name__ == '__main__':
             haser = all_words(h.read().split('\n'))
         assert len(maleh) == len(haser)
 
-        sefaria = get_from_sefaria(dir)
+        # An incremental run is for picking up Sefaria's edits, so the cached text won't do
+        sefaria = get_from_sefaria(dir, max_age=0 if args.incremental else None)
 
-        aligned = align_texts(maleh, haser, sefaria)
+        if args.interactive:
+            # Decisions are journaled as they are made, so an interrupted session loses nothing
+            os.makedirs(journal_path, exist_ok=True)
+            aligned = align_texts_manually(maleh, haser, sefaria, dir, journal_path + dir + '.jsonl')
+        else:
+            conflicts = []
+            realigned = None
+            if args.incremental and os.path.exists(aligned_path + dir + '.json'):
+                with open(aligned_path + dir + '.json', encoding='utf-8') as f:
+                    previous = unlabel_pages(json.load(f))
+                realigned = realign_changed_pages(maleh, haser, sefaria, previous, conflicts)
+
+            if realigned is None:
+                aligned = align_texts(maleh, haser, sefaria, conflicts)
+            else:
+                aligned, changed = realigned
+                print(str(len(changed)) + ' changed pages re-aligned')
+                # Keep the earlier conflicts of the pages that were not re-aligned
+                if os.path.exists(conflicts_path + dir + '.json'):
+                    changed_labels = set(page_label(p) for p in changed)
+                    with open(conflicts_path + dir + '.json', encoding='utf-8') as f:
+                        kept = [c for c in json.load(f) if c['page'] not in changed_labels]
+                    conflicts = sorted(kept + conflicts,
+                                       key=lambda c: (int(c['page'][:-1]), c['page'][-1], c['chunk'], c['word']))
+
+            # Low-confidence spans are left for review after the fact
+            os.makedirs(conflicts_path, exist_ok=True)
+            with open(conflicts_path + dir + '.json', 'w+', encoding='utf-8') as f:
+                json.dump(conflicts, f, ensure_ascii=False, indent=4)
+            print(str(len(conflicts)) + ' low-confidence spans written to ' + conflicts_path + dir + '.json')
 
         tagged = [[{'type': 'm'}]]
         for p in aligned:
@@ -167,5 +358,5 @@ if __name__ == '__main__':
 
         labeled = label_pages(tagged)
 
-        with open('./data/aligned_talmud/' + dir + '.json', 'w+', encoding='utf-8') as path:
-            json.dump(labeled, path, ensure_ascii=False, indent=4)
+        with open(aligned_path + dir + '.json', 'w+', encoding='utf-8') as f:
+            json.dump(labeled, f, ensure_ascii=False, indent=4)
@@ -1,11 +1,35 @@
 import os
 import json
-import requests
+from utils import fetch
+from utils import sources
 from utils.rlprint import rlprint
 from utils import hebrew
 import re
 
 
+class CharFilter(dict):
+    """
+    A str.translate table that deletes every character not in keep. Each character is only looked up in
+    Python the first time it is seen; after that, str.translate finds it in the table itself.
+    """
+    def __init__(self, keep):
+        super().__init__((ord(c), ord(c)) for c in keep)
+
+    def __missing__(self, key):
+        self[key] = None
+        return None
+
+
+# Multi-character entries of hebrew.all_nikkud can never equal a single character, so they are left out
+no_punctuation = CharFilter(hebrew.alphabet + ' ')
+no_punctuation_with_nikkud = CharFilter(hebrew.alphabet + ' ' + ''.join(c for c in hebrew.all_nikkud if len(c) == 1))
+
+braces = re.compile(r'\{.*\}')
+parentheses = re.compile(r'\(.*\)')
+angle_brackets_or_parentheses = re.compile(r'[<\(].*[\)>]')
+square_brackets_or_parentheses = re.compile(r'[\[\(].*[\)\]]')
+
+
 def basic_clean(txt):
     if type(txt) == list:
         txt = ' '.join(txt)
@@ -14,74 +38,170 @@ def basic_clean(txt):
 
 
 def remove_punctuation(txt, has_nikkud=False):
-    return ''.join([char for char in txt
-                    if char in hebrew.alphabet + ' '
-                    or (has_nikkud and char in hebrew.all_nikkud)])
+    return txt.translate(no_punctuation_with_nikkud if has_nikkud else no_punctuation)
 
 
 def clean_bible(txt):
     txt = basic_clean(txt)
     txt = txt.replace('־', ' ')
-    txt = re.sub(r'\{.*\}', '', txt)
+    txt = braces.sub('', txt)
     return remove_punctuation(txt, has_nikkud=True)
 
 
 def clean_mishna(txt):
     txt = basic_clean(txt)
-    txt = re.sub(r'\(.*\)', '', txt)
+    txt = parentheses.sub('', txt)
     return remove_punctuation(txt, has_nikkud=True)
 
 
 def clean_tosefta(txt):
     txt = basic_clean(txt)
-    txt = re.sub(r'[<\(].*[\)>]', '', txt)
+    txt = angle_brackets_or_parentheses.sub('', txt)
     return remove_punctuation(txt)
 
 
 def clean_sifra(txt):
     txt = basic_clean(txt)
-    txt = re.sub(r'[\[\(].*[\)\]]', '', txt)
+    txt = square_brackets_or_parentheses.sub('', txt)
     txt = txt.replace('...', '')
     return remove_punctuation(txt)
 
 
 def clean_sifrei(txt):
     txt = basic_clean(txt)
-    txt = re.sub(r'\(.*\)', '', txt)
+    txt = parentheses.sub('', txt)
     return remove_punctuation(txt)
 
 
-def get_connections(name, page, chunk):
-    all_connections = requests.get('https://www.sefaria.org/api/links/' + name + '.' + page + '.' + str(chunk))
-    all_connections = json.loads(json.dumps(all_connections.json()))
+def links_url(name, page, chunk):
+    return 'https://www.sefaria.org/api/links/' + name + '.' + page + '.' + str(chunk) + links_params()
 
-    # Bible Processing
-    bible = [con for con in all_connections if con['category'] == 'Tanakh']
-    bible = ' '.join([clean_bible(con['he']) for con in bible])
 
-    # Mishna Processing
-    mishna = [con for con in all_connections if con['category'] == 'Mishnah']
-    mishna = ' '.join([clean_mishna(con['he']) for con in mishna])
+def page_links_url(name, first_page, last_page=None):
+    pages = first_page if last_page is None or last_page == first_page else first_page + '-' + last_page
+    return 'https://www.sefaria.org/api/links/' + name + '.' + pages + links_params()
 
-    # Tosefta Processing
-    tosefta = [con for con in all_connections if con['category'] == 'Tosefta']
-    tosefta = ' '.join([clean_tosefta(con['he']) for con in tosefta])
 
-    # Sifra Processing
-    sifra = [con for con in all_connections if con['index_title'] == 'Sifra']
-    sifra = ' '.join([clean_sifra(con['he']) for con in sifra])
+def links_params():
+    # Once the source corpora are prefetched (scripts/prefetch_sources.py), the texts are looked up locally
+    return '?with_text=0' if sources.is_prefetched() else ''
 
-    # Sifrei Processing
-    sifrei = [con for con in all_connections if con['index_title'] in ('Sifrei Bamidbar', 'Sifrei Devarim')]
-    sifrei = ' '.join([clean_sifrei(con['he']) for con in sifrei])
 
-    return bible, mishna, tosefta, sifra, sifrei
+def get_connections(name, page, chunk):
+    """
+    :return: the refs of the Bible, Mishna, Tosefta, Sifra and Sifrei sources linked from the chunk, whose
+             cleaned texts are in the source store (see utils/sources.py)
+    """
+    return categorize_connections(fetch.get_json(links_url(name, page, chunk)))
+
+
+def expand_anchor(anchor, chunk_counts):
+    """
+    Turns the Talmud ref a link is anchored to (e.g. 'Moed Katan 2a:3', 'Meilah 2a:3-5', 'Meilah 2a:7-2b:1',
+    'Meilah 2a' or 'Meilah 2a-2b') into the list of (page, chunk) it covers, chunks being numbered from 1.
+
+    :param chunk_counts: dict from page to its number of chunks, in page order
+    """
+    section = anchor.rsplit(' ', 1)[-1]
+    start, _, end = section.partition('-')
+    start_page, _, start_chunk = start.partition(':')
+    if end == '':
+        if start_chunk == '':   # The link is anchored to the whole page
+            return [(start_page, c) for c in range(1, chunk_counts.get(start_page, 0) + 1)]
+        return [(start_page, int(start_chunk))]
+
+    if start_chunk == '':   # Anchored to whole pages, e.g. 'Meilah 2a-2b'
+        end_page, end_chunk = end, ''
+    else:
+        end_page, _, end_chunk = end.rpartition(':')
+        end_page = end_page if end_page != '' else start_page
+    # A missing chunk number means the page is covered from its start, or to its end
+    first_chunk = int(start_chunk) if start_chunk != '' else 1
+    last_chunk = int(end_chunk) if end_chunk != '' else chunk_counts.get(end_page, 0)
+    if end_page == start_page:
+        return [(start_page, c) for c in range(first_chunk, last_chunk + 1)]
+    # Anchored across one or more page boundaries, so every page in between is covered whole
+    pages = list(chunk_counts)
+    if start_page in chunk_counts and end_page in chunk_counts:
+        middle_pages = pages[pages.index(start_page) + 1:pages.index(end_page)]
+    else:
+        middle_pages = []
+    return [(start_page, c) for c in range(first_chunk, chunk_counts.get(start_page, 0) + 1)] \
+        + [(page, c) for page in middle_pages for c in range(1, chunk_counts[page] + 1)] \
+        + [(end_page, c) for c in range(1, last_chunk + 1)]
+
+
+def bucket_connections(all_connections, chunk_counts):
+    """
+    Distributes the links of a range of pages among the chunks they are anchored to.
+
+    :return: dict from (page, chunk) to the list of links of that chunk
+    """
+    buckets = {}
+    for con in all_connections:
+        anchors = con.get('anchorRefExpanded') or [con['anchorRef']]
+        covered = []
+        for anchor in anchors:
+            covered += [pc for pc in expand_anchor(anchor, chunk_counts) if pc not in covered]
+        for page_chunk in covered:
+            buckets.setdefault(page_chunk, []).append(con)
+    return buckets
+
+
+def source_he(con):
+    """
+    :return: the Hebrew text of a link's source, from the link itself, the prefetched corpora or Sefaria
+    """
+    if 'he' in con:
+        return con['he']
+    he = sources.corpus_ref_text(con['ref'])
+    if he is None:
+        he = fetch.get_json('https://www.sefaria.org/api/texts/' + con['ref'] + '?context=0')['he']
+        he = [segment for _, segment in sources.flatten(he)]
+    return he
+
+
+# Where each kind of link goes in the tuple returned by categorize_connections, and how its text is cleaned;
+# links are routed by their category, or failing that by their title
+categories = {'Tanakh': (0, clean_bible),
+              'Mishnah': (1, clean_mishna),
+              'Tosefta': (2, clean_tosefta)}
+index_titles = {'Sifra': (3, clean_sifra),
+                'Sifrei Bamidbar': (4, clean_sifrei),
+                'Sifrei Devarim': (4, clean_sifrei)}
+
+
+def categorize_connections(all_connections):
+    """
+    Sorts links into Bible, Mishna, Tosefta, Sifra and Sifrei sources in a single pass, cleaning the texts
+    that are not in the source store yet and adding them to it.
+
+    :return: the refs of each kind of source, without duplicates
+    """
+    refs = ([], [], [], [], [])
+    for con in all_connections:
+        route = categories.get(con['category']) or index_titles.get(con['index_title'])
+        if route is None:
+            continue
+        slot, clean_fn = route
+        if not sources.has_source(con['ref']):
+            sources.add_source(con['ref'], clean_fn(source_he(con)))
+        if con['ref'] not in refs[slot]:
+            refs[slot].append(con['ref'])
+    return refs
 
 
 files = os.listdir('./data/aligned_talmud/')
 
+# At most this many link requests are in flight at once, at no more than requests_per_second on average
+workers = 8
+requests_per_second = 10
+# Number of amudim whose links are requested together
+pages_per_request = 1
+
 
 if __name__ == '__main__':
+    fetch.set_rate(requests_per_second)
 
     for file in files:
         title = file[:-5]
@@ -92,12 +212,29 @@ if __name__ == '__main__':
         with open('./data/aligned_talmud/' + file, encoding='utf-8') as f:
             text = json.load(f)
 
+        # Links are requested for pages_per_request amudim at a time, and distributed among their chunks by
+        # the refs they are anchored to. The requests are made concurrently; the responses come back in order
+        chunk_counts = {p['page']: len(p['content']) for p in text}
+        page_ranges = [text[i:i + pages_per_request] for i in range(0, len(text), pages_per_request)]
+        urls = [page_links_url(title, r[0]['page'], r[-1]['page']) for r in page_ranges]
+        print('Fetching ' + str(len(urls)) + ' page ranges...')
+        chunk_links = {}
+        seen = set()
+        for response in fetch.get_all_json(urls, workers):
+            for page_chunk, links in bucket_connections(response, chunk_counts).items():
+                # A link anchored across two page ranges comes back in both responses
+                for con in links:
+                    key = (page_chunk, con.get('_id', con['ref']))
+                    if key not in seen:
+                        seen.add(key)
+                        chunk_links.setdefault(page_chunk, []).append(con)
+
         linked = []
         for p in text:
             linked.append({'page': p['page'], 'content': []})
             for c in range(len(p['content'])):
                 print(p['page'] + ':' + str(c + 1))
-                connections = get_connections(title, p['page'], c + 1)
+                connections = categorize_connections(chunk_links.get((p['page'], c + 1), []))
                 linked[-1]['content'].append({'type': p['content'][c]['type'],
                                               'text': p['content'][c]['text'],
                                               'bible': connections[0],
@@ -106,7 +243,8 @@ if __name__ == '__main__':
                                               'sifra': connections[3],
                                               'sifrei': connections[4]})
                 for i in connections:
-                    rlprint(i)
+                    rlprint(' '.join(sources.source_text(ref) for ref in i))
 
         with open('./data/connected_talmud/' + title + '.json', 'w+', encoding='utf-8') as path:
             json.dump(linked, path, ensure_ascii=False, indent=4)
+        sources.save_store()
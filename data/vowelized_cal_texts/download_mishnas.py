@@ -1,14 +1,18 @@
-import requests
 import re
 import string
 import json
+from utils import fetch
+from utils import sources
 
 """
 Downloads the raw text of every masekhet of mishna, for the purpose of creating a corpus of all words
 in Rabbinic Hebrew. Text of the Mishna with nikkud is downloaded from Sefaria.
+Must be run from the root directory, e.g. python -m data.vowelized_cal_texts.download_mishnas
 """
 
-with open('mishna_titles.txt') as f: mishnas = f.readlines()
+folder = './data/vowelized_cal_texts/'
+
+with open(folder + 'mishna_titles.txt') as f: mishnas = f.readlines()
 mishnas = [m.strip('\n') for m in mishnas]
 
 complete_text = ''
@@ -17,18 +21,15 @@ if __name__ == '__main__':
     for name in mishnas:
         print(name)
 
-        if name != 'Pirkei Avot':
-            length = requests.get('http://www.sefaria.org/api/texts/Mishnah_' + name)
-        else:
-            length = requests.get('http://www.sefaria.org/api/texts/' + name)
-        length = json.loads(json.dumps(length.json()))['length']
+        title = 'Mishnah ' + name if name != 'Pirkei Avot' else name
 
-        if name != 'Pirkei Avot':
-            original = requests.get('http://www.sefaria.org/api/texts/Mishnah_' + name + '.1-' + str(length))
+        # Use the corpus prefetched by scripts/prefetch_sources.py, if there is one
+        if title in sources.corpus_index():
+            original = sources.corpus_text(title)
         else:
-            original = requests.get('http://www.sefaria.org/api/texts/' + name + '.1-' + str(length))
-
-        original = json.loads(json.dumps(original.json()))['he']
+            length = fetch.get_json('http://www.sefaria.org/api/texts/' + title.replace(' ', '_'))['length']
+            original = fetch.get_json('http://www.sefaria.org/api/texts/' + title.replace(' ', '_') + '.1-'
+                                      + str(length))['he']
         original = [m for ch in original for m in ch]
 
         merged = (' '.join(original)).replace('\n', '')
@@ -40,5 +41,5 @@ if __name__ == '__main__':
     stripped = re.sub(r'\s+', ' ', complete_text)
     for_training = [{'lang': 'R', 'word': w} for w in stripped.split()]
 
-    with open('Mishna.json', 'w+', encoding='utf-8') as f:
+    with open(folder + 'Mishna.json', 'w+', encoding='utf-8') as f:
         json.dump(for_training, f, ensure_ascii=False, indent=4)
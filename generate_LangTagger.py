@@ -1,34 +1,191 @@
-from sklearn import svm
+import argparse
 import json
+import time
 import joblib
+import numpy as np
 from src.languagetagger.utils import *
+from src.languagetagger.backends import backends, make_classifier, scale_gamma
+from src.languagetagger import compact
 
 
 train_data_path = './data/vowelized_cal_texts/71667_each_training_data.json'
 out_path = './src/languagetagger/'
 
 # Python unfortunately can't handle all 140,000+ pieces of data :(
+# (unless it is streamed; see --stream)
 sample_size = 20000
 
+# Settings of the streaming mode
+batch_size = 2000       # Words per partial_fit call, half of each language
+epochs = 5
+holdout_every = 20      # Every 20th word of each language is held out for testing
+
+
+def split_data(data, sample_size):
+    """
+    data[:sample_size] + data[-sample_size:] = the same number of Hebrew and Aramaic words for training;
+    the words in between are held out for testing.
+
+    :return: (train words, train labels), (test words, test labels)
+    """
+    train = data[:sample_size] + data[-sample_size:]
+    test = data[sample_size:-sample_size]
+    return ([clean(d['word']) for d in train], [d['tag'] for d in train]), \
+           ([clean(d['word']) for d in test], [d['tag'] for d in test])
+
+
+def stream_json_array(path, buffer_size=1 << 16):
+    """
+    Yields the items of a JSON array file one at a time, holding only a small part of the file in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in '[, \t\r\n':
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError('Buffer exhausted', buffer, pos)
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The next item is cut off by the end of the buffer
+                if eof:
+                    if buffer[pos:].strip() == '':
+                        return
+                    raise
+                more = f.read(buffer_size)
+                eof = more == ''
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+            yield item
+
+
+def stream_words(path):
+    """
+    Yields (word, tag, held out) for the words of the training data, alternating between Aramaic and Hebrew
+    words (the file holds all of one language, then all of the other), each language read by its own stream.
+    """
+    streams = [(d for d in stream_json_array(path) if d['tag'] == tag) for tag in ('A', 'R')]
+    count = 0
+    while len(streams) > 0:
+        for stream in list(streams):
+            d = next(stream, None)
+            if d is None:
+                streams.remove(stream)
+                continue
+            yield clean(d['word']), d['tag'], (count // 2) % holdout_every == holdout_every - 1
+            count += 1
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:     # Not available on Windows
+        return float('nan')
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def featurizer_settings(features, words, dim=None):
+    """
+    :param features: 'onehot' or 'hashed'
+    :param words: the training words (an iterable), which fix the dimension of one-hot vectors
+    :param dim: the dimension of hashed vectors
+    :return: the settings of utils.make_featurizer, which are saved with the model
+    """
+    if features == 'hashed':
+        return {'kind': 'hashed', 'dim': dim or hashed_dim, 'ngrams': max_ngram, 'affixes': max_affix}
+    return {'kind': 'onehot', 'dim': max(len(word) for word in words) * len(characters)}
+
+
+def train_streaming(path, features='onehot', dim=None):
+    """
+    Trains the 'sgd' backend on every word of the training data, in batches of sparse vectors, so that memory
+    use is bounded by the batch size rather than by the size of the data.
+    """
+    start = time.perf_counter()
+
+    # The dimension of one-hot vectors is fixed by the longest word, which takes one pass to find
+    words = (word for word, _, _ in stream_words(path)) if features == 'onehot' else []
+    settings = featurizer_settings(features, words, dim)
+    featurize = make_featurizer(settings)
+    print('Dimension: ' + str(settings['dim']))
+
+    lang_clf = make_classifier('sgd')
+    test_words, test_labels = [], []
+    for epoch in range(epochs):
+        words, labels = [], []
+        for word, tag, held_out in stream_words(path):
+            if held_out:
+                if epoch == 0:
+                    test_words.append(word)
+                    test_labels.append(tag)
+                continue
+            words.append(word)
+            labels.append(tag)
+            if len(words) == batch_size:
+                lang_clf.partial_fit(featurize(words), labels, classes=['A', 'R'])
+                words, labels = [], []
+        if len(words) > 0:
+            lang_clf.partial_fit(featurize(words), labels, classes=['A', 'R'])
+
+        correct = 0
+        for i in range(0, len(test_words), batch_size):
+            predictions = lang_clf.predict(featurize(test_words[i:i + batch_size]))
+            correct += np.sum(predictions == np.array(test_labels[i:i + batch_size]))
+        print('Epoch {}: held-out accuracy {:.4f} on {} words'.format(epoch + 1, correct / len(test_words),
+                                                                      len(test_words)))
+
+    print('Wall time: {:.1f} s, peak RSS: {:.0f} MB'.format(time.perf_counter() - start, peak_rss_mb()))
+    lang_clf.featurizer = settings
+    return lang_clf
+
+
 if __name__ == '__main__':
-    with open(train_data_path, encoding='utf-8') as f:
-        data = json.load(f)
-    print('Data loaded...')
+    parser = argparse.ArgumentParser(description='Trains the Gemara language tagger.')
+    parser.add_argument('backend', nargs='?', choices=backends,
+                        help='classifier to train (see src/languagetagger/backends.py; default svc, or sgd with '
+                             '--stream)')
+    parser.add_argument('--stream', action='store_true',
+                        help='train the sgd backend on all of the data, streamed in batches')
+    parser.add_argument('--features', default='onehot', choices=('onehot', 'hashed'),
+                        help='one-hot vectors of the characters by position, or hashed character n-grams and '
+                             'prefixes/suffixes, which have a fixed dimension and fit tokens of any length')
+    parser.add_argument('--dim', type=int, help='dimension of hashed vectors (default {})'.format(hashed_dim))
+    args = parser.parse_args()
+    # Only the sgd backend can be trained in batches
+    if args.stream and args.backend not in (None, 'sgd'):
+        parser.error('--stream only trains the sgd backend, not ' + args.backend)
+    args.backend = args.backend or ('sgd' if args.stream else 'svc')
+
+    if args.stream:
+        lang_clf = train_streaming(train_data_path, args.features, args.dim)
+    else:
+        with open(train_data_path, encoding='utf-8') as f:
+            data = json.load(f)
+        print('Data loaded...')
 
-    # data[:sample_size] + data[-sample_size:] = the same number of Hebrew and Aramaic words
-    train_labels = [d['tag'] for d in data[:sample_size] + data[-sample_size:]]
-    train_words = [clean(d['word']) for d in data[:sample_size] + data[-sample_size:]]
-    print('Data separated and cleaned...')
+        (train_words, train_labels), _ = split_data(data, sample_size)
+        print('Data separated and cleaned...')
 
-    dimension = max([len(word) for word in train_words]) * len(characters)
-    print(dimension)
-    train_vecs = [tok_to_vec(word, dimension) for word in train_words]
-    print('Vectors generated...')
+        settings = featurizer_settings(args.features, train_words, args.dim)
+        print(settings['dim'])
+        train_vecs = make_featurizer(settings)(train_words)
+        print('Vectors generated...')
 
-    lang_clf = svm.SVC(probability=True)
-    lang_clf.fit(train_vecs, train_labels)
-    print('Model completed...')
+        lang_clf = make_classifier(args.backend, gamma=scale_gamma(train_vecs))
+        lang_clf.fit(train_vecs, train_labels)
+        # Saved with the model, so that gemaratagger.py encodes words the same way
+        lang_clf.featurizer = settings
+        print('Model completed...')
 
     with open(out_path + 'GemaraLanguageTagger.joblib', 'wb') as f:
         joblib.dump(lang_clf, f)
+    compact.save(lang_clf, out_path + 'GemaraLanguageTagger/')
     print('Done!')
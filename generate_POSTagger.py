@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import time
+from utils import yap
+from utils import yapcache
+from tag_heb_pos import prep_for_yap, plan_units
+from src.postagger.perceptron import PerceptronTagger, normalize
+from src.postagger import hebrewtagger
+
+"""
+Trains the embedded POS tagger (see src/postagger/) on what YAP tagged: the chunks of data/pos_tagged_talmud, and
+the tagging units of data/lang_tagged_talmud whose lattices are in YAP's cache (see utils/yapcache.py). Every
+holdout_every-th sequence is held out to report how often the tagger agrees with YAP and how fast it is; the saved
+model is then trained on all of them.
+Run from the root directory: python generate_POSTagger.py [--epochs 5]
+"""
+
+lang_tagged_path = './data/lang_tagged_talmud/'
+pos_tagged_path = './data/pos_tagged_talmud/'
+
+epochs = 5
+holdout_every = 10
+
+
+def tagged_sequences():
+    """
+    :return: {phrase: (tokens, YAP's POS of each token)}, for every sequence YAP is known to have tagged
+    """
+    sequences = {}
+    for file in sorted(os.listdir(pos_tagged_path)):
+        with open(pos_tagged_path + file, encoding='utf-8') as f:
+            pos_tagged = json.load(f)
+        for page in pos_tagged:
+            for chunk in page:
+                seq = prep_for_yap(chunk)
+                if len(seq) > 0:
+                    sequences[yap.to_phrase(seq)] = (seq, [word['pos'] for word in chunk])
+
+    for file in sorted(os.listdir(lang_tagged_path)):
+        with open(lang_tagged_path + file, encoding='utf-8') as f:
+            text = json.load(f)
+        for seq in plan_units(text)[1]:
+            lattice = yapcache.load(yap.to_phrase(seq)) if len(seq) > 0 else None
+            if lattice is None:
+                continue
+            pos_tags = yap.sequence_pos(lattice)
+            # YAP occasionally merges or drops tokens, in which case the tags can't be lined up
+            if len(pos_tags) == len(seq):
+                sequences[yap.to_phrase(seq)] = (seq, pos_tags)
+    return sequences
+
+
+def agreement(tagger, sequences, tag_sequences):
+    """
+    :return: the fraction of all tokens, and of Hebrew tokens (not '.'), given the same POS as by YAP
+    """
+    agree, total, heb_agree, heb_total = 0, 0, 0, 0
+    for seq, truth in zip(sequences, tag_sequences):
+        for token, guess, tag in zip(seq, tagger.tag(seq), truth):
+            agree += guess == tag
+            total += 1
+            if normalize(token) != '.':
+                heb_agree += guess == tag
+                heb_total += 1
+    return agree / max(total, 1), heb_agree / max(heb_total, 1)
+
+
+def words_per_second(tagger, sequences, min_time=1.0):
+    words, elapsed, start = 0, 0.0, time.perf_counter()
+    while elapsed < min_time:
+        for seq in sequences:
+            tagger.tag(seq)
+            words += len(seq)
+        elapsed = time.perf_counter() - start
+    return words / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Trains the embedded Rabbinic Hebrew POS tagger.')
+    parser.add_argument('--epochs', type=int, default=epochs)
+    parser.add_argument('--holdout-every', type=int, default=holdout_every,
+                        help='every nth sequence is held out to report agreement with YAP')
+    args = parser.parse_args()
+
+    data = list(tagged_sequences().values())
+    if len(data) == 0:
+        raise SystemExit('Nothing tagged by YAP to train on; run tag_heb_pos.py first')
+    train = [d for i, d in enumerate(data) if i % args.holdout_every != args.holdout_every - 1]
+    test = [d for i, d in enumerate(data) if i % args.holdout_every == args.holdout_every - 1]
+    print('{} sequences ({} words): {} for training, {} held out'.format(
+        len(data), sum(len(seq) for seq, _ in data), len(train), len(test)))
+
+    start = time.perf_counter()
+    pos_tagger = PerceptronTagger()
+    pos_tagger.train([seq for seq, _ in train], [tags for _, tags in train], args.epochs)
+    print('Trained in {:.1f} s'.format(time.perf_counter() - start))
+
+    if len(test) > 0:
+        overall, hebrew = agreement(pos_tagger, [seq for seq, _ in test], [tags for _, tags in test])
+        print('Agreement with YAP on held-out words: {:.2%} of all, {:.2%} of Hebrew'.format(overall, hebrew))
+    print('Tagging speed: {:,.0f} words per second'.format(words_per_second(pos_tagger, [seq for seq, _ in data])))
+
+    pos_tagger = PerceptronTagger()
+    pos_tagger.train([seq for seq, _ in data], [tags for _, tags in data], args.epochs)
+    pos_tagger.save(hebrewtagger.model_path)
+    print('Done!')
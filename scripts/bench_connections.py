@@ -0,0 +1,124 @@
+import json
+import re
+import sys
+import time
+import connect_sources
+from utils import fetch
+from utils import hebrew
+from utils import sources
+
+"""
+Benchmarks connect_sources.categorize_connections against the previous implementation (one scan of the links
+per category, with cleaners that recompile their regexes and filter characters one by one), on recorded
+/api/links/ responses.
+The responses must have been recorded beforehand, e.g. TALMUD_FETCH_MODE=record python connect_sources.py
+Run from the root directory: python -m scripts.bench_connections [tractate] [repetitions]
+"""
+
+
+def legacy_remove_punctuation(txt, has_nikkud=False):
+    return ''.join([char for char in txt
+                    if char in hebrew.alphabet + ' '
+                    or (has_nikkud and char in hebrew.all_nikkud)])
+
+
+def legacy_clean_bible(txt):
+    txt = connect_sources.basic_clean(txt)
+    txt = txt.replace('־', ' ')
+    txt = re.sub(r'\{.*\}', '', txt)
+    return legacy_remove_punctuation(txt, has_nikkud=True)
+
+
+def legacy_clean_mishna(txt):
+    txt = connect_sources.basic_clean(txt)
+    txt = re.sub(r'\(.*\)', '', txt)
+    return legacy_remove_punctuation(txt, has_nikkud=True)
+
+
+def legacy_clean_tosefta(txt):
+    txt = connect_sources.basic_clean(txt)
+    txt = re.sub(r'[<\(].*[\)>]', '', txt)
+    return legacy_remove_punctuation(txt)
+
+
+def legacy_clean_sifra(txt):
+    txt = connect_sources.basic_clean(txt)
+    txt = re.sub(r'[\[\(].*[\)\]]', '', txt)
+    txt = txt.replace('...', '')
+    return legacy_remove_punctuation(txt)
+
+
+def legacy_clean_sifrei(txt):
+    txt = connect_sources.basic_clean(txt)
+    txt = re.sub(r'\(.*\)', '', txt)
+    return legacy_remove_punctuation(txt)
+
+
+def legacy_categorize_connections(all_connections):
+    bible = [con for con in all_connections if con['category'] == 'Tanakh']
+    bible = ' '.join([legacy_clean_bible(con['he']) for con in bible])
+    mishna = [con for con in all_connections if con['category'] == 'Mishnah']
+    mishna = ' '.join([legacy_clean_mishna(con['he']) for con in mishna])
+    tosefta = [con for con in all_connections if con['category'] == 'Tosefta']
+    tosefta = ' '.join([legacy_clean_tosefta(con['he']) for con in tosefta])
+    sifra = [con for con in all_connections if con['index_title'] == 'Sifra']
+    sifra = ' '.join([legacy_clean_sifra(con['he']) for con in sifra])
+    sifrei = [con for con in all_connections if con['index_title'] in ('Sifrei Bamidbar', 'Sifrei Devarim')]
+    sifrei = ' '.join([legacy_clean_sifrei(con['he']) for con in sifrei])
+    return bible, mishna, tosefta, sifra, sifrei
+
+
+def unique_refs(links):
+    # The first link of each ref
+    seen = set()
+    unique = []
+    for con in links:
+        if con['ref'] not in seen:
+            seen.add(con['ref'])
+            unique.append(con)
+    return unique
+
+
+def time_runs(fn, chunks, repetitions):
+    best = float('inf')
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        for links in chunks:
+            fn(links)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def fresh_categorize(links):
+    # Nothing is memoized between repetitions, so that both versions clean every text
+    sources._store = {}
+    return connect_sources.categorize_connections(links)
+
+
+if __name__ == '__main__':
+    title = sys.argv[1] if len(sys.argv) > 1 else 'Meilah'
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    fetch.set_mode('replay')
+    with open('./data/aligned_talmud/' + title + '.json', encoding='utf-8') as f:
+        text = json.load(f)
+    chunk_counts = {p['page']: len(p['content']) for p in text}
+    chunks = []
+    for p in text:
+        # Stored responses include the texts, so the local corpora are not consulted
+        response = fetch.get_json('https://www.sefaria.org/api/links/' + title + '.' + p['page'])
+        buckets = connect_sources.bucket_connections(response, chunk_counts)
+        chunks += [buckets.get((p['page'], c + 1), []) for c in range(len(p['content']))]
+    print(str(len(chunks)) + ' chunks, ' + str(sum(len(links) for links in chunks)) + ' links')
+
+    sources._store = {}
+    for links in chunks:
+        # categorize_connections keeps each ref once, so it is compared to the links without repeated refs
+        expected = legacy_categorize_connections(unique_refs(links))
+        refs = connect_sources.categorize_connections(links)
+        assert all(' '.join(sources.source_text(ref) for ref in refs[k]) == expected[k] for k in range(5))
+
+    legacy = time_runs(legacy_categorize_connections, chunks, repetitions)
+    current = time_runs(fresh_categorize, chunks, repetitions)
+    print('previous:  {:.4f} s'.format(legacy))
+    print('current:   {:.4f} s ({:.1f}x)'.format(current, legacy / current))
@@ -0,0 +1,53 @@
+import argparse
+import json
+import time
+import numpy as np
+from generate_LangTagger import train_data_path, sample_size, split_data, featurizer_settings
+from src.languagetagger.utils import *
+from src.languagetagger.backends import backends, make_classifier, scale_gamma
+
+"""
+Trains the language tagger with each backend of src/languagetagger/backends.py on the same training words as
+generate_LangTagger.py, and reports its accuracy on the held-out words together with its training time and
+its prediction speed.
+With --features hashed, the words are encoded with hashed n-grams instead of one-hot vectors.
+Run from the root directory: python -m scripts.bench_language_models [backend ...] [--features hashed]
+"""
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('backends', nargs='*', default=backends)
+    parser.add_argument('--features', default='onehot', choices=('onehot', 'hashed'))
+    parser.add_argument('--dim', type=int)
+    args = parser.parse_args()
+
+    with open(train_data_path, encoding='utf-8') as f:
+        data = json.load(f)
+    (train_words, train_labels), (test_words, test_labels) = split_data(data, sample_size)
+
+    settings = featurizer_settings(args.features, train_words, args.dim)
+    featurize = make_featurizer(settings)
+    train_vecs = featurize(train_words)
+    # Held-out words longer than any training word cannot be encoded with one-hot vectors
+    fits = [i for i in range(len(test_words))
+            if settings['kind'] == 'hashed' or len(test_words[i]) * len(characters) <= settings['dim']]
+    test_vecs = featurize([test_words[i] for i in fits])
+    test_labels = np.array([test_labels[i] for i in fits])
+    print('{} training words, {} held-out words ({} too long to encode)'.format(
+        len(train_words), len(fits), len(test_words) - len(fits)))
+
+    gamma = scale_gamma(train_vecs)
+    print('{:<10}{:>10}{:>12}{:>14}'.format('backend', 'accuracy', 'train (s)', 'words/sec'))
+    for backend in args.backends:
+        lang_clf = make_classifier(backend, gamma=gamma)
+        start = time.perf_counter()
+        lang_clf.fit(train_vecs, train_labels)
+        train_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        probs = lang_clf.predict_proba(test_vecs)
+        predict_time = time.perf_counter() - start
+
+        predictions = lang_clf.classes_[np.argmax(probs, axis=1)]
+        accuracy = np.mean(predictions == test_labels)
+        print('{:<10}{:>10.4f}{:>12.1f}{:>14.0f}'.format(backend, accuracy, train_time, len(fits) / predict_time))
@@ -0,0 +1,69 @@
+import subprocess
+import sys
+
+"""
+Reports how long each pipeline module takes to import, in a fresh interpreter each time (so that nothing is
+already imported or loaded), and how long the resources it loads on first use take afterwards.
+Run from the root directory: python -m scripts.bench_startup [module ...] [--repetitions N]
+"""
+
+modules = ['utils.deconstruct', 'utils.fetch', 'utils.sources', 'utils.align',
+           'src.languagetagger.utils', 'src.languagetagger.identifiers', 'src.languagetagger.gemaratagger',
+           'translators.aramaic_translator', 'translators.bible_translator', 'translators.hebrew_translator',
+           'align_and_classify', 'connect_sources', 'tag_language', 'tag_heb_pos', 'generate_LangTagger']
+
+# The first use of each module's deferred resources
+first_uses = {
+    'utils.deconstruct': 'm._get_prefix_rules()',
+    'src.languagetagger.identifiers': 'm._get_dicta_all()',
+    'src.languagetagger.gemaratagger': 'm._get_model()',
+    'translators.aramaic_translator': 'm._get_dicta_mapping()',
+    'translators.bible_translator': 'm._get_bdb_mapping()',
+}
+
+timer = '''
+import importlib, time
+start = time.perf_counter()
+m = importlib.import_module({module!r})
+imported = time.perf_counter()
+try:
+    {first_use}
+    print(imported - start, time.perf_counter() - imported)
+except OSError:
+    # The resource isn't available here
+    print(imported - start, 'nan')
+'''
+
+
+def time_import(module):
+    """
+    :return: (import time, first use time) in seconds, or None if the module can't be imported here; the first
+             use time is nan if its resource can't be loaded
+    """
+    code = timer.format(module=module, first_use=first_uses.get(module, 'pass'))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return tuple(float(t) for t in result.stdout.split()[-2:])
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    repetitions = 3
+    if '--repetitions' in args:
+        i = args.index('--repetitions')
+        repetitions = int(args[i + 1])
+        args = args[:i] + args[i + 2:]
+    chosen = args if len(args) > 0 else modules
+
+    print('{:<36}{:>12}{:>16}'.format('module', 'import (ms)', 'first use (ms)'))
+    for module in chosen:
+        # The fastest of several runs, since the first ones also warm the disk cache
+        times = [time_import(module) for _ in range(repetitions)]
+        if None in times:
+            print('{:<36}{:>12}'.format(module, 'failed'))
+            continue
+        import_time = min(t[0] for t in times) * 1000
+        first_use = '{:.1f}'.format(min(t[1] for t in times) * 1000) if module in first_uses else '-'
+        first_use = 'missing' if first_use == 'nan' else first_use
+        print('{:<36}{:>12.1f}{:>16}'.format(module, import_time, first_use))
@@ -0,0 +1,90 @@
+import json
+import os
+from utils import fetch
+from utils import sources
+
+"""
+Downloads every source corpus that the Talmud links to (Tanakh, Mishnah, Tosefta, Sifra and Sifrei) once,
+concurrently, into a local indexed store (data/source_corpus, see utils/sources.py). After this has run,
+connect_sources.py resolves the text of every link locally and download_mishnas.py builds the Mishnah corpus
+without the Sefaria API.
+Run from the root directory: python -m scripts.prefetch_sources
+"""
+
+# Same categories as connect_sources.categorize_connections
+categories = ('Tanakh', 'Mishnah', 'Tosefta')
+titles = ('Sifra', 'Sifrei Bamidbar', 'Sifrei Devarim')
+
+workers = 8
+requests_per_second = 10
+
+
+def api_name(title):
+    return title.replace(' ', '_')
+
+
+def find_books(toc):
+    """
+    Walks Sefaria's table of contents for the base texts (not commentaries or translations) of the categories
+    and titles above.
+
+    :return: list of (title, category)
+    """
+    books = []
+    for node in toc:
+        if 'contents' in node:
+            books += find_books(node['contents'])
+        elif 'title' in node and not node.get('dependence'):
+            category = node.get('categories', [''])[0]
+            if category in categories or node['title'] in titles:
+                books.append((node['title'], category))
+    return books
+
+
+def leaf_titles(schema, prefix):
+    """
+    :return: the titles of the parts of a text that hold a jagged array, e.g. 'Sifra, Vayikra Dibbura DeNedavah'
+    """
+    if 'nodes' not in schema:
+        return [prefix]
+    leaves = []
+    for node in schema['nodes']:
+        # Default nodes are addressed by the title of their parent
+        title = prefix if node.get('default') else prefix + ', ' + node['title']
+        leaves += leaf_titles(node, title)
+    return leaves
+
+
+if __name__ == '__main__':
+    fetch.set_rate(requests_per_second)
+
+    books = find_books(fetch.get_json('https://www.sefaria.org/api/index/'))
+    print(str(len(books)) + ' books found')
+
+    indices = fetch.get_all_json(['https://www.sefaria.org/api/v2/raw/index/' + api_name(title)
+                                  for title, _ in books], workers)
+    leaves = [(leaf, category) for (title, category), index in zip(books, indices)
+              for leaf in leaf_titles(index['schema'], title)]
+    print(str(len(leaves)) + ' texts to download')
+
+    # As in download_mishnas.py: first the number of sections of each text, then all of its sections at once
+    lengths = fetch.get_all_json(['http://www.sefaria.org/api/texts/' + api_name(leaf) for leaf, _ in leaves],
+                                 workers)
+    texts = fetch.get_all_json(['http://www.sefaria.org/api/texts/' + api_name(leaf) + '.1-' + str(length['length'])
+                                for (leaf, _), length in zip(leaves, lengths)], workers)
+
+    os.makedirs(sources.corpus_path, exist_ok=True)
+    index = {}
+    for (leaf, category), text in zip(leaves, texts):
+        he = text['he']
+        # A single section comes back as a flat list
+        if len(he) > 0 and type(he[0]) == str and text.get('textDepth', 2) > 1:
+            he = [he]
+        file_name = api_name(leaf.replace(',', '')) + '.json'
+        with open(sources.corpus_path + file_name, 'w+', encoding='utf-8') as f:
+            json.dump({'title': leaf, 'category': category, 'he': he}, f, ensure_ascii=False)
+        index[leaf] = {'category': category, 'file': file_name}
+
+    with open(sources.corpus_path + 'index.json', 'w+', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=4)
+    print('Done!')
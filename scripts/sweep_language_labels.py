@@ -0,0 +1,65 @@
+import argparse
+import json
+import time
+import numpy as np
+from src.languagetagger import relabel
+
+"""
+Relabels the languages of tractates from the probabilities saved by tag_language.py (see
+src/languagetagger/relabel.py), for every combination of the given thresholds, trigram weights and boundaries,
+and reports how many words get each language and how many labels differ from the current settings'.
+With --apply, writes the labels of a single setting to the language-tagged tractates instead.
+Run from the root directory: python -m scripts.sweep_language_labels [tractate ...] [--thresholds 0.7 0.8 ...]
+"""
+
+lang_tagged_path = './data/lang_tagged_talmud/'
+
+
+def apply(title, labels):
+    # Replaces the languages of a tractate's language-tagged words, which are in the same order as the labels
+    with open(lang_tagged_path + title + '.json', encoding='utf-8') as f:
+        lang_tagged = json.load(f)
+    words = [word for page in lang_tagged for chunk in page for word in chunk['text']]
+    for word, lang in zip(words, relabel.languages[labels]):
+        word['lang'] = str(lang)
+    with open(lang_tagged_path + title + '.json', 'w+', encoding='utf-8') as f:
+        json.dump(lang_tagged, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('tractates', nargs='*', help='default: every tractate with saved probabilities')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.7, 0.75, 0.8, 0.85, 0.9],
+                        help='P(Hebrew) above which a word is Hebrew; below 1 - threshold it is Aramaic')
+    parser.add_argument('--weights', type=float, nargs='+', default=[1.0, 1.2, 1.5])
+    parser.add_argument('--boundaries', type=float, nargs='+', default=[0.05, 0.1, 0.2])
+    parser.add_argument('--apply', action='store_true',
+                        help='write the labels of the (single) given threshold, weight and boundary')
+    args = parser.parse_args()
+
+    settings = [(t, w, b) for t in args.thresholds for w in args.weights for b in args.boundaries]
+    if args.apply and len(settings) != 1:
+        parser.error('--apply needs a single threshold, weight and boundary')
+
+    for title in args.tractates or relabel.titles():
+        arrays = relabel.load(title)
+        if args.apply:
+            threshold, weight, boundary = settings[0]
+            apply(title, relabel.relabel(arrays, threshold, 1 - threshold, weight, boundary))
+            print('Relabeled ' + title)
+            continue
+
+        start = time.perf_counter()
+        current = relabel.relabel(arrays)
+        results = [(setting, relabel.relabel(arrays, setting[0], 1 - setting[0], setting[1], setting[2]))
+                   for setting in settings]
+        elapsed = time.perf_counter() - start
+
+        print('{} ({} words, {} settings in {:.3f} s)'.format(title, len(current), len(settings), elapsed))
+        print('{:>10}{:>8}{:>10}'.format('threshold', 'weight', 'boundary')
+              + ''.join('{:>8}'.format(lang) for lang in relabel.languages) + '{:>10}'.format('changed'))
+        for (threshold, weight, boundary), labels in results:
+            counts = np.bincount(labels, minlength=len(relabel.languages))
+            print('{:>10}{:>8}{:>10}'.format(threshold, weight, boundary)
+                  + ''.join('{:>8}'.format(count) for count in counts)
+                  + '{:>10}'.format(int(np.sum(labels != current))))
@@ -0,0 +1,76 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils import yapcache
+
+"""
+A stand-in for a YAP server, which answers from the lattices cached by utils/yapcache.py, so that
+tag_heb_pos.py can be benchmarked and tested without YAP. Requests with a phrase that isn't cached get a 404.
+Run from the root directory: python -m scripts.yap_stub_server [--port 8000]
+Then, so that the requests reach the stub: python tag_heb_pos.py --no-cache
+"""
+
+stats = {'requests': 0, 'sentences': 0, 'misses': 0}
+stats_lock = threading.Lock()
+
+
+def replay(text):
+    """
+    :return: the md_lattice of the text, or None if any of its sentences isn't cached
+    """
+    # Every sentence ends with a double space (see yap.to_phrase)
+    sentences = [sentence + '  ' for sentence in text.split('  ')[:-1]]
+    lattices = [yapcache.load(sentence) for sentence in sentences]
+    with stats_lock:
+        stats['requests'] += 1
+        stats['sentences'] += len(sentences)
+        stats['misses'] += sum(lattice is None for lattice in lattices)
+    if None in lattices:
+        return None
+    return ''.join(lattices)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            md_lattice = replay(json.loads(body.decode('utf-8'))['text'])
+        except (ValueError, KeyError):
+            self.respond(400, {'error': 'Expected a JSON body with a text field'})
+            return
+        if md_lattice is None:
+            self.respond(404, {'error': 'Phrase not in the YAP lattice cache'})
+        else:
+            self.respond(200, {'md_lattice': md_lattice})
+
+    do_POST = do_GET
+
+    def respond(self, status, content):
+        data = json.dumps(content, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    count, total_bytes = yapcache.size()
+    print('Replaying {} cached lattices on port {}'.format(count, args.port))
+    server = ThreadingHTTPServer(('localhost', args.port), StubHandler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print('{} requests, {} sentences, {} not cached'.format(stats['requests'], stats['sentences'],
+                                                            stats['misses']))
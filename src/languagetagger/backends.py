@@ -0,0 +1,47 @@
+from sklearn import svm
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.pipeline import make_pipeline
+
+"""
+The classifiers the Gemara language tagger can be trained with. All of them take the sparse vectors of
+utils.toks_to_csr and give probabilities through predict_proba.
+- 'svc' = RBF-kernel SVM with Platt scaling; the original model. Prediction cost grows with the number of
+          support vectors.
+- 'linear' = logistic regression on the sparse vectors themselves; the fastest to train and apply.
+- 'nystroem' = logistic regression on a Nystroem approximation of the SVM's RBF kernel.
+- 'rff' = logistic regression on random Fourier features approximating the same kernel.
+- 'sgd' = logistic regression fit by stochastic gradient descent; the only one that can learn incrementally
+          with partial_fit, for training on all of the data (see generate_LangTagger.py --stream).
+"""
+
+backends = ('svc', 'linear', 'nystroem', 'rff', 'sgd')
+
+# Number of components of the kernel approximations
+n_components = 1000
+# Inverse regularization strength of the logistic regressions; the explicit features need much less
+# regularization than the SVM's dual coefficients to reach a comparable accuracy
+linear_C = 10
+approximation_C = 100
+
+
+def scale_gamma(vecs):
+    # The RBF gamma SVC uses by default (gamma='scale'), so that the approximations match its kernel
+    variance = vecs.multiply(vecs).mean() - vecs.mean() ** 2
+    return 1.0 / (vecs.shape[1] * variance) if variance > 0 else 1.0
+
+
+def make_classifier(backend, gamma=1.0, random_state=0):
+    if backend == 'svc':
+        return svm.SVC(probability=True)
+    elif backend == 'linear':
+        return LogisticRegression(C=linear_C, max_iter=1000)
+    elif backend == 'nystroem':
+        return make_pipeline(Nystroem(gamma=gamma, n_components=n_components, random_state=random_state),
+                             LogisticRegression(C=approximation_C, max_iter=1000))
+    elif backend == 'rff':
+        return make_pipeline(RBFSampler(gamma=gamma, n_components=n_components, random_state=random_state),
+                             LogisticRegression(C=approximation_C, max_iter=1000))
+    elif backend == 'sgd':
+        return SGDClassifier(loss='log_loss', alpha=1e-5, random_state=random_state)
+    raise ValueError('Unknown backend: ' + backend)
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import numpy as np
+from scipy import sparse
+
+"""
+An export of the trained language model as plain NumPy arrays, one .npy file each, with a small JSON header.
+The arrays are opened with np.load(mmap_mode='r'), so loading takes milliseconds and every process that uses the
+model shares the same copy of them in the page cache, instead of unpickling its own.
+
+Supported models: SVC (RBF kernel, with probability=True), LogisticRegression and SGDClassifier(loss='log_loss'),
+the latter two optionally after a Nystroem or RBFSampler kernel approximation (see backends.py).
+
+Run from the root directory to export an existing joblib model:
+python -m src.languagetagger.compact [model.joblib] [export directory]
+"""
+
+header_file = 'model.json'
+
+
+def _dense(array):
+    return array.toarray() if sparse.issparse(array) else np.asarray(array)
+
+
+def _compact_dtype(array):
+    # The support vectors of a one-hot or hashed model are binary, so they fit in one byte per entry
+    return array.astype(np.uint8) if np.array_equal(array, array.astype(np.uint8)) else array
+
+
+def _arrays(lang_clf):
+    """
+    :return: the header and the arrays of a fitted model
+    """
+    # Models trained before the featurizer was saved with them use one-hot vectors (see gemaratagger.py)
+    header = {'classes': [str(c) for c in lang_clf.classes_],
+              'featurizer': getattr(lang_clf, 'featurizer',
+                                    {'kind': 'onehot', 'dim': getattr(lang_clf, 'n_features_in_', 968)})}
+    if hasattr(lang_clf, 'steps'):
+        approximation, classifier = lang_clf.steps[0][1], lang_clf.steps[-1][1]
+    else:
+        approximation, classifier = None, lang_clf
+
+    arrays = {}
+    if hasattr(classifier, 'support_vectors_'):
+        if classifier.kernel != 'rbf' or not classifier.probability:
+            raise ValueError('Only RBF-kernel SVCs with probability=True can be exported')
+        header['kind'] = 'svc'
+        header['gamma'] = float(classifier._gamma)
+        support_vectors = _dense(classifier.support_vectors_)
+        arrays['support_vectors'] = _compact_dtype(support_vectors)
+        arrays['support_norms'] = np.einsum('ij,ij->i', support_vectors, support_vectors)
+        arrays['dual_coef'] = _dense(classifier.dual_coef_)[0]
+        arrays['platt'] = np.array([classifier.probA_[0], classifier.probB_[0]])
+    elif hasattr(classifier, 'coef_'):
+        header['kind'] = 'linear'
+        arrays['coef'] = _dense(classifier.coef_)[0]
+    else:
+        raise ValueError('Cannot export a ' + type(classifier).__name__)
+    arrays['intercept'] = np.asarray(classifier.intercept_, dtype=np.float64)
+
+    if approximation is None:
+        header['transform'] = None
+    elif hasattr(approximation, 'normalization_'):
+        header['transform'] = 'nystroem'
+        header['transform_gamma'] = float(approximation.gamma)
+        components = _dense(approximation.components_)
+        arrays['components'] = components
+        arrays['component_norms'] = np.einsum('ij,ij->i', components, components)
+        arrays['normalization'] = approximation.normalization_
+    elif hasattr(approximation, 'random_weights_'):
+        header['transform'] = 'rff'
+        arrays['random_weights'] = approximation.random_weights_
+        arrays['random_offset'] = approximation.random_offset_
+    else:
+        raise ValueError('Cannot export a ' + type(approximation).__name__)
+    return header, arrays
+
+
+def save(lang_clf, path):
+    """
+    Exports a fitted model to the directory path.
+    """
+    header, arrays = _arrays(lang_clf)
+    digest = hashlib.sha256(json.dumps(header, sort_keys=True).encode('utf-8'))
+    os.makedirs(path, exist_ok=True)
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(name.encode('utf-8') + array.tobytes())
+        np.save(os.path.join(path, name + '.npy'), array)
+    header['arrays'] = sorted(arrays)
+    # Identifies the model, e.g. for probcache
+    header['hash'] = digest.hexdigest()
+    with open(os.path.join(path, header_file), 'w+', encoding='utf-8') as f:
+        json.dump(header, f, ensure_ascii=False, indent=4)
+
+
+def exists(path):
+    return os.path.exists(os.path.join(path, header_file))
+
+
+def _rbf(x, x_norms, centers, center_norms, gamma):
+    # exp(-gamma * |x - center|^2) for every row of x and every center, with x sparse
+    x = sparse.csr_matrix(x, dtype=np.float64)
+    dots = np.asarray(x @ centers.T, dtype=np.float64)
+    return np.exp(-gamma * np.maximum(x_norms[:, None] - 2 * dots + center_norms[None, :], 0))
+
+
+def _pairwise_coupling(r):
+    """
+    libsvm's multiclass_probability for two classes, as used by SVC.predict_proba, run on all rows at once:
+    it starts from equal probabilities and stops as soon as they are within its tolerance, so it does not quite
+    reach the Platt-scaled probability r of the first class when that is near 0.5.
+    """
+    q = np.stack([np.stack([(1 - r) ** 2, -(1 - r) * r], axis=1),
+                  np.stack([-r * (1 - r), r ** 2], axis=1)], axis=1)
+    p = np.full((len(r), 2), 0.5)
+    qp = np.einsum('ntj,nj->nt', q, p)
+    pqp = np.einsum('nt,nt->n', p, qp)
+    active = np.ones(len(r), dtype=bool)
+    for _ in range(100):
+        active &= np.abs(qp - pqp[:, None]).max(axis=1) >= 0.005 / 2
+        if not active.any():
+            break
+        for t in range(2):
+            diff = np.where(active, (pqp - qp[:, t]) / q[:, t, t], 0)
+            p[:, t] += diff
+            pqp = (pqp + diff * (diff * q[:, t, t] + 2 * qp[:, t])) / (1 + diff) ** 2
+            qp = (qp + diff[:, None] * q[:, t, :]) / (1 + diff)[:, None]
+            p /= (1 + diff)[:, None]
+    return p
+
+
+class CompactModel:
+    """
+    Reads an exported model, memory-mapped, and predicts like the model it was exported from.
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, header_file), encoding='utf-8') as f:
+            header = json.load(f)
+        self.header = header
+        self.classes_ = np.array(header['classes'])
+        self.hash = header['hash']
+        self.featurizer = header['featurizer']
+        self.arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                       for name in header['arrays']}
+
+    def _features(self, x):
+        a = self.arrays
+        if self.header['transform'] == 'nystroem':
+            x_norms = np.asarray(sparse.csr_matrix(x).multiply(x).sum(axis=1)).ravel()
+            kernel = _rbf(x, x_norms, a['components'], a['component_norms'], self.header['transform_gamma'])
+            return kernel @ a['normalization'].T
+        elif self.header['transform'] == 'rff':
+            projection = np.asarray(sparse.csr_matrix(x) @ a['random_weights']) + a['random_offset']
+            return np.cos(projection) * np.sqrt(2.0) / np.sqrt(a['random_weights'].shape[1])
+        return x
+
+    def decision_function(self, x):
+        a = self.arrays
+        features = self._features(x)
+        if self.header['kind'] == 'svc':
+            x_norms = np.asarray(sparse.csr_matrix(features).multiply(features).sum(axis=1)).ravel()
+            kernel = _rbf(features, x_norms, a['support_vectors'], a['support_norms'], self.header['gamma'])
+            return kernel @ a['dual_coef'] + a['intercept'][0]
+        return np.asarray(features @ a['coef']).ravel() + a['intercept'][0]
+
+    def predict_proba(self, x):
+        decision = self.decision_function(x)
+        if self.header['kind'] == 'svc':
+            # Platt scaling of libsvm's decision values, which have the opposite sign of sklearn's
+            slope, offset = self.arrays['platt']
+            first = np.clip(1 / (1 + np.exp(-decision * slope + offset)), 1e-7, 1 - 1e-7)
+            return _pairwise_coupling(first)
+        second = 1 / (1 + np.exp(-decision))
+        return np.stack([1 - second, second], axis=1)
+
+    def predict(self, x):
+        return self.classes_[np.argmax(self.predict_proba(x), axis=1)]
+
+
+def load(path):
+    return CompactModel(path)
+
+
+if __name__ == '__main__':
+    import sys
+    import joblib
+    model_path = sys.argv[1] if len(sys.argv) > 1 else './src/languagetagger/GemaraLanguageTagger.joblib'
+    compact_path = sys.argv[2] if len(sys.argv) > 2 else './src/languagetagger/GemaraLanguageTagger/'
+    save(joblib.load(model_path), compact_path)
+    print('Exported ' + model_path + ' to ' + compact_path)
@@ -1,14 +1,69 @@
-import joblib
+import hashlib
 from src.languagetagger.utils import *
+from src.languagetagger import compact
+from src.languagetagger import probcache
 
 model_path = './src/languagetagger/GemaraLanguageTagger.joblib'
-lang_clf = joblib.load(model_path)
+# The same model exported as memory-mapped arrays (see compact.py), used instead of the joblib file if present
+compact_path = './src/languagetagger/GemaraLanguageTagger/'
 
+# The model and its featurizer are loaded on first use, so that importing this module is cheap
+_lang_clf = None
+_featurize = None
 
-def tag_gemara_chunk(words_for_tagging):
-    cleaned_words = [clean(word) for word in words_for_tagging]
-    word_vectors = [tok_to_vec(word) for word in cleaned_words]
+
+def _get_model():
+    global _lang_clf, _featurize
+    if _lang_clf is None:
+        if compact.exists(compact_path):
+            _lang_clf = compact.load(compact_path)
+            probcache.load(_lang_clf.hash)
+        else:
+            import joblib
+            _lang_clf = joblib.load(model_path)
+            with open(model_path, 'rb') as f:
+                probcache.load(hashlib.sha256(f.read()).hexdigest())
+        # The featurizer the model was trained with; models trained before it was saved with them use one-hot
+        # vectors, whose dimension is 968 if sklearn didn't record it either
+        _featurize = make_featurizer(getattr(_lang_clf, 'featurizer',
+                                             {'kind': 'onehot', 'dim': getattr(_lang_clf, 'n_features_in_', 968)}))
+    return _lang_clf
+
+
+def classify(cleaned_words):
+    lang_clf = _get_model()
+    word_vectors = _featurize(cleaned_words)
+    # An SVC only accepts sparse input if it was trained on sparse input
+    if not getattr(lang_clf, '_sparse', True):
+        word_vectors = word_vectors.toarray()
     predictions = lang_clf.predict_proba(word_vectors)
-    print(predictions)
     #       prob[1] = probability of being Hebrew = 1 - P(Aramaic)
     return [prob[1] for prob in predictions]
+
+
+def tag_gemara_chunk(words_for_tagging):
+    # Only words that have never been seen with this model are classified (loading the model loads its cache)
+    _get_model()
+    return probcache.get_probs([clean(word) for word in words_for_tagging], classify)
+
+
+def tag_gemara_chunks(chunks, window=20000):
+    """
+    Classifies the words of many chunks with as few calls to the model as possible, since the overhead of each
+    call dominates for short chunks.
+
+    :param chunks: list of lists of words
+    :param window: maximum number of words classified in one call
+    :return: the probability of each word being Hebrew, as a list for each chunk
+    """
+    all_words = [word for chunk in chunks for word in chunk]
+    all_langs = []
+    for i in range(0, len(all_words), window):
+        all_langs += tag_gemara_chunk(all_words[i:i + window])
+
+    chunk_langs = []
+    start = 0
+    for chunk in chunks:
+        chunk_langs.append(all_langs[start:start + len(chunk)])
+        start += len(chunk)
+    return chunk_langs
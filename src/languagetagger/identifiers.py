@@ -1,24 +1,69 @@
 from utils.deconstruct import *
+from utils import hebrew
+from utils import sources
 import numpy as np
 
 dicta_words_path = './src/languagetagger/dicta_all_words_only.csv'
-with open(dicta_words_path, encoding='utf-8') as f:
-    dicta_all = f.read().split('\n')[1:]
-    dicta_all = frozenset(dicta_all)
+_dicta_all = None
+
+
+def _get_dicta_all():
+    global _dicta_all
+    if _dicta_all is None:
+        with open(dicta_words_path, encoding='utf-8') as f:
+            _dicta_all = frozenset(f.read().split('\n')[1:])
+    return _dicta_all
 
 
 def is_in_dicta(word_forms):
     # Dicta uses haser spelling convention
-    return word_forms[2] in dicta_all
+    return word_forms[2] in _get_dicta_all()
+
+
+source_characters = frozenset(hebrew.alphabet) | frozenset(hebrew.all_nikkud)
+
+
+def source_word(word):
+    # The same characters that connect_sources.remove_punctuation leaves in the source texts
+    return ''.join([c for c in word if c in source_characters])
+
+
+def source_index(text, voweled=True):
+    """
+    Tokenizes a source text once, so that looking up a word in it is a single hash probe rather than a
+    substring scan (which also matched parts of words).
+
+    :return: frozenset of the words of the text, with nikkud if voweled, and always without nikkud
+    """
+    words = text.split()
+    unvoweled = frozenset(remove_nikkud(word) for word in words)
+    return unvoweled | frozenset(words) if voweled else unvoweled
+
+
+def chunk_indexes(chunk):
+    """
+    :return: token sets of the chunk's Biblical, Mishnaic and other Tannaitic (Tosefta, Sifra, Sifrei) sources
+    """
+    tanna = '{} {} {}'.format(sources.chunk_sources(chunk, 'tosefta'),
+                              sources.chunk_sources(chunk, 'sifra'),
+                              sources.chunk_sources(chunk, 'sifrei'))
+    return (source_index(sources.chunk_sources(chunk, 'bible')),
+            source_index(sources.chunk_sources(chunk, 'mishna')),
+            source_index(tanna, voweled=False))
+
+
+def is_in_bible(word, bible):
+    return word != '' and source_word(word) in bible
 
 
 def is_in_mishna(word_forms, mishna):
+    word_forms = [source_word(word) for word in word_forms]
     return any([(word != '' and word in mishna) for word in word_forms]) \
            or any([(word != '' and heb_plural(word) in mishna) for word in word_forms])
 
 
 def is_in_tanna(word_forms, tanna):
-    unvoweled_forms = [remove_nikkud(word) for word in word_forms]
+    unvoweled_forms = [remove_nikkud(source_word(word)) for word in word_forms]
     return any([(word != '' and word in tanna) for word in unvoweled_forms]) \
            or any([(word != '' and heb_plural(word, voweled=False) in tanna) for word in unvoweled_forms])
 
@@ -42,13 +87,13 @@ def is_valid_trigram(prev, after):
     return prev['lang'] != 'B' and after['lang'] != 'B'
 
 
-def disambiguate_chunk(chunk_tagged, chunk_text, chunk_langs, chunk):
+def disambiguate_chunk(chunk_tagged, chunk_text, chunk_langs, tanna):
     for i in range(len(chunk_tagged)):
         if chunk_tagged[i]['lang'] != 'U':
             continue
 
         # Check the Tannaitic sources to see if the word appears there, in which case it is Hebrew
-        if is_in_tanna(chunk_text[i], '{} {} {}'.format(chunk['tosefta'], chunk['sifra'], chunk['sifrei'])):
+        if is_in_tanna(chunk_text[i], tanna):
             chunk_tagged[i]['lang'] = 'R'
         elif i + 1 < len(chunk_tagged) and i - 1 >= 0:
             # If the context on both sides is Biblical, then the word is probably Biblical, but spelled differently
@@ -0,0 +1,66 @@
+import json
+import os
+
+"""
+A cache of the language model's P(Hebrew) for each cleaned token. The vocabulary of the Talmud is far smaller
+than its number of words, so most words never need to go through the model.
+
+The cache has an in-memory tier and an on-disk tier, which persists across tractates and runs. Its file is
+named after the hash of the model's contents, so retraining the model invalidates it automatically.
+"""
+
+cache_path = './data/lang_prob_cache/'
+
+model_hash = None
+prob_cache = {}
+hits = 0
+misses = 0
+
+
+def load(new_model_hash):
+    global model_hash, prob_cache
+    model_hash = new_model_hash
+    prob_cache = {}
+    if not os.path.exists(cache_path):
+        return
+    for file in os.listdir(cache_path):
+        if file == model_hash + '.json':
+            with open(cache_path + file, encoding='utf-8') as f:
+                prob_cache = json.load(f)
+        elif file.endswith('.json'):
+            # Probabilities of an older model
+            os.remove(cache_path + file)
+
+
+def save():
+    # Nothing to save if the model was never loaded
+    if model_hash is None:
+        return
+    os.makedirs(cache_path, exist_ok=True)
+    tmp_path = cache_path + model_hash + '.json.tmp'
+    with open(tmp_path, 'w+', encoding='utf-8') as f:
+        json.dump(prob_cache, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path + model_hash + '.json')
+
+
+def get_probs(tokens, classify):
+    """
+    :param tokens: cleaned tokens
+    :param classify: function from a list of tokens to their probabilities, called once with the unseen tokens
+    :return: the probability of each token
+    """
+    global hits, misses
+    # Each distinct unseen token is classified once; every other lookup is a hit
+    unseen = list(dict.fromkeys(token for token in tokens if token not in prob_cache))
+    misses += len(unseen)
+    hits += len(tokens) - len(unseen)
+    if len(unseen) > 0:
+        prob_cache.update(zip(unseen, (float(p) for p in classify(unseen))))
+    return [prob_cache[token] for token in tokens]
+
+
+def report():
+    total = hits + misses
+    rate = hits / total if total > 0 else 0
+    return '{} lookups, {} hits, {} classified by the model ({:.1%} hit rate), {} tokens cached'.format(
+        total, hits, misses, rate, len(prob_cache))
@@ -0,0 +1,123 @@
+import os
+import numpy as np
+
+"""
+The language model's P(Hebrew) for every word of a tractate, kept by tag_language.py in a compact side file
+together with everything else its labels depend on, so that the labels can be recomputed for other thresholds
+and trigram settings without classifying the words again.
+
+Each tractate is saved as ./data/lang_probs/<title>.npz with one entry per word:
+- probs: P(Hebrew) as float32 (NaN for the words of Mishna chunks, which aren't classified)
+- flags: uint8 bits IN_BIBLE, IN_MISHNA and IN_TANNA, for the words found in the chunk's sources
+and one entry per chunk:
+- chunk_sizes: number of words
+- chunk_types: index in chunk_types
+- chunk_pages: index of the chunk's page
+relabel() then reproduces tag_language.py's labelling with array operations over the whole tractate.
+"""
+
+probs_path = './data/lang_probs/'
+
+chunk_types = ('m', 'mc', 'g', 'gc')
+languages = np.array(['A', 'B', 'R', 'U'])
+A, B, R, U = range(4)
+
+IN_BIBLE = 1
+IN_MISHNA = 2
+IN_TANNA = 4
+
+# The settings tag_language.py labels with
+upper = 0.8
+lower = 0.2
+weight = 1.2
+boundary = 0.1
+
+
+def save(title, probs, flags, chunk_sizes, chunk_type_names, chunk_pages):
+    os.makedirs(probs_path, exist_ok=True)
+    np.savez_compressed(probs_path + title + '.npz',
+                        probs=np.array(probs, dtype=np.float32),
+                        flags=np.array(flags, dtype=np.uint8),
+                        chunk_sizes=np.array(chunk_sizes, dtype=np.int32),
+                        chunk_types=np.array([chunk_types.index(t) for t in chunk_type_names], dtype=np.uint8),
+                        chunk_pages=np.array(chunk_pages, dtype=np.int32))
+
+
+def load(title):
+    with np.load(probs_path + title + '.npz') as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def titles():
+    if not os.path.exists(probs_path):
+        return []
+    return sorted(file[:-4] for file in os.listdir(probs_path) if file.endswith('.npz'))
+
+
+def trigram_stat(prev, curr, after, weight=weight):
+    # identifiers.trigram_language_disambiguate, before comparing to the boundary
+    return (prev + after) / 2 + weight * curr
+
+
+def relabel(arrays, upper=upper, lower=lower, weight=weight, boundary=boundary):
+    """
+    :param arrays: a tractate's arrays, as returned by load
+    :return: the language of each word, as indices in languages
+    """
+    probs = arrays['probs'].astype(np.float64)
+    flags = arrays['flags']
+    sizes = arrays['chunk_sizes']
+    types = np.repeat(arrays['chunk_types'], sizes)
+    is_mishna = types <= chunk_types.index('mc')
+    in_bible = (flags & IN_BIBLE) > 0
+    in_mishna = (flags & IN_MISHNA) > 0
+
+    # Mishnas are either Biblical or Rabbinic Hebrew; Gemara words are found in the sources or go by probability
+    labels = np.full(len(probs), U, dtype=np.uint8)
+    labels[is_mishna] = np.where(in_bible[is_mishna], B, R)
+    gemara = ~is_mishna
+    labels[gemara & (probs < lower)] = A
+    labels[gemara & (probs > upper)] = R
+    labels[gemara & in_mishna] = R
+    labels[gemara & in_bible] = B
+
+    # Disambiguation of the unidentified words (identifiers.disambiguate_chunk). A word it changes never becomes
+    # 'B', so a word's neighbours are 'B' before the disambiguation if and only if they are 'B' after it, and
+    # every unidentified word can be decided at once.
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    ends = starts + np.repeat(sizes, sizes)
+    unidentified = np.flatnonzero(labels == U)
+    in_tanna = (flags[unidentified] & IN_TANNA) > 0
+    inner = (unidentified - 1 >= starts[unidentified]) & (unidentified + 1 < ends[unidentified])
+    prev_label = labels[np.maximum(unidentified - 1, 0)]
+    next_label = labels[np.minimum(unidentified + 1, len(labels) - 1)]
+    biblical = inner & (prev_label == B) & (next_label == B)
+    trigram = inner & (prev_label != B) & (next_label != B)
+    stat = trigram_stat(probs[np.maximum(unidentified - 1, 0)], probs[unidentified],
+                        probs[np.minimum(unidentified + 1, len(probs) - 1)], weight)
+    decided = np.where(stat < 1 - boundary, A, np.where(stat > 1 + boundary, R, U))
+    new_labels = np.where(in_tanna, R, np.where(biblical, B, np.where(trigram, decided, U)))
+    labels[unidentified] = new_labels
+
+    # Gemaras that continue across a page: the last word of the previous page is decided by its trigram with the
+    # first word of the page. There are few chunks, so this follows tag_language.py's loop.
+    pages = arrays['chunk_pages']
+    chunk_starts = np.cumsum(sizes) - sizes
+    gc = chunk_types.index('gc')
+    last_words = None
+    for c in range(len(sizes)):
+        if arrays['chunk_types'][c] in (chunk_types.index('m'), chunk_types.index('mc')):
+            continue
+        start, size = chunk_starts[c], sizes[c]
+        first_on_page = c == 0 or pages[c - 1] != pages[c]
+        if arrays['chunk_types'][c] == gc and first_on_page and last_words is not None and last_words[1][1] == U:
+            if last_words[0][1] != B and size > 0 and labels[start] != B and sizes[c - 1] > 0:
+                # start - 1 is the last word of the last chunk of the previous page
+                stat = trigram_stat(last_words[0][0], last_words[1][0], probs[start], weight)
+                labels[start - 1] = A if stat < 1 - boundary else (R if stat > 1 + boundary else U)
+        elif arrays['chunk_types'][c] == gc and size >= 2:
+            last_words = [(probs[start + size - 2], labels[start + size - 2]),
+                          (probs[start + size - 1], labels[start + size - 1])]
+        else:
+            last_words = [(0, B), (0, B)]
+    return labels
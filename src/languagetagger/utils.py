@@ -1,3 +1,7 @@
+import re
+import numpy as np
+from scipy import sparse
+
 # Constants
 nikkud = ['ֹ', 'ְ', 'ּ', 'ׁ', 'ׂ', 'ָ', 'ֵ', 'ַ', 'ֶ', 'ִ', 'ֻ', 'ֱ', 'ֲ', 'ֳ', 'ׇ']
 alphabet = ['א', 'ב', 'ג', 'ד', 'ה', 'ו', 'ז', 'ח', 'ט', 'י', 'כ', 'ך', 'ל', 'מ',
@@ -5,6 +9,10 @@ alphabet = ['א', 'ב', 'ג', 'ד', 'ה', 'ו', 'ז', 'ח', 'ט', 'י', 'כ', '
 punctuation = ['״', '׳']
 characters = alphabet + nikkud + punctuation
 
+# Index of each character in characters, by code point (-1 for every other character)
+char_table = np.full(max(ord(c) for c in characters) + 1, -1, dtype=np.int64)
+char_table[[ord(c) for c in characters]] = np.arange(len(characters))
+
 
 # Turns a token into a vector
 # dim is the vector dimension parameter. By default it is 968 because that happens to be the dimension of the current
@@ -17,6 +25,71 @@ def tok_to_vec(token, dim=968):
     return vec
 
 
+# Turns a list of tokens into a sparse matrix with one row per token, equal to tok_to_vec of that token.
+# The whole batch is encoded with array operations, without building a vector for each token.
+def toks_to_csr(tokens, dim=968):
+    lengths = np.fromiter((len(token) for token in tokens), dtype=np.int64, count=len(tokens))
+    indptr = np.zeros(len(tokens) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+
+    codes = np.frombuffer(''.join(tokens).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    char_ids = char_table[np.minimum(codes, len(char_table) - 1)]
+    if (char_ids < 0).any() or (codes >= len(char_table)).any():
+        raise ValueError('Tokens must be cleaned before encoding')
+    positions = np.arange(len(codes)) - np.repeat(indptr[:-1], lengths)
+    if len(positions) > 0 and positions.max() * len(characters) + len(characters) > dim:
+        raise ValueError('Token too long for dimension ' + str(dim))
+
+    return sparse.csr_matrix((np.ones(len(codes)), positions * len(characters) + char_ids, indptr),
+                             shape=(len(tokens), dim))
+
+
+# A letter (or geresh/gershayim) together with the nikkud written under and over it
+cluster_pattern = re.compile('[' + ''.join(alphabet + punctuation) + '][' + ''.join(nikkud) + ']*')
+
+# Default settings of the hashed featurizer
+hashed_dim = 2 ** 14
+max_ngram = 4
+max_affix = 3
+
+
+# The features of a token for the hashed featurizer:
+# - the character n-grams of the token, nikkud included, with '<' and '>' marking its beginning and end
+# - its first and last clusters (letters with their nikkud), e.g. the vowelled prefix דְּ, and the same
+#   prefixes and suffixes without nikkud
+def hashed_features(token, ngrams=max_ngram, affixes=max_affix):
+    features = []
+    marked = '<' + token + '>'
+    for n in range(1, ngrams + 1):
+        features += [marked[i:i + n] for i in range(len(marked) - n + 1)]
+    clusters = cluster_pattern.findall(token)
+    for k in range(1, min(affixes, len(clusters)) + 1):
+        features += ['P:' + ''.join(clusters[:k]), 'S:' + ''.join(clusters[-k:]),
+                     'p:' + ''.join(c[0] for c in clusters[:k]), 's:' + ''.join(c[0] for c in clusters[-k:])]
+    return features
+
+
+# Turns a list of tokens into a sparse matrix of hashed features with a fixed number of columns, whatever the
+# length of the tokens
+def toks_to_hashed(tokens, dim=hashed_dim, ngrams=max_ngram, affixes=max_affix):
+    # Imported here, since sklearn takes a while to import and the one-hot featurizer doesn't need it
+    from sklearn.feature_extraction.text import HashingVectorizer
+    vectorizer = HashingVectorizer(analyzer=lambda token: hashed_features(token, ngrams, affixes),
+                                   n_features=dim, alternate_sign=False, norm=None, binary=True)
+    return vectorizer.transform(tokens)
+
+
+# Returns the function that turns tokens into vectors for a model, given the featurizer settings saved with it:
+# {'kind': 'onehot', 'dim': ...} for toks_to_csr, or {'kind': 'hashed', 'dim': ..., 'ngrams': ..., 'affixes': ...}
+def make_featurizer(settings):
+    if settings['kind'] == 'onehot':
+        return lambda tokens: toks_to_csr(tokens, settings['dim'])
+    elif settings['kind'] == 'hashed':
+        return lambda tokens: toks_to_hashed(tokens, settings['dim'], settings.get('ngrams', max_ngram),
+                                             settings.get('affixes', max_affix))
+    raise ValueError('Unknown featurizer: ' + settings['kind'])
+
+
 # Removes any extraneous characters that hadn't been eliminated earlier
 def clean(token):
     return ''.join([c for c in token if c in characters])
\ No newline at end of file
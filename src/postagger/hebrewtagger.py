@@ -0,0 +1,27 @@
+from src.postagger.perceptron import PerceptronTagger
+
+"""
+An in-process stand-in for YAP (see generate_POSTagger.py), with the same interface as tag_heb_pos.tag_heb_pos.
+"""
+
+model_path = './src/postagger/HebrewPOSTagger.json'
+
+# The model is loaded on first use, so that importing this module is cheap
+_tagger = None
+
+
+def _get_model():
+    global _tagger
+    if _tagger is None:
+        _tagger = PerceptronTagger.load(model_path)
+    return _tagger
+
+
+def tag_heb_pos(seq):
+    return _get_model().tag(seq)
+
+
+def tag_all(seqs):
+    # The same as yap.tag_all
+    tagger = _get_model()
+    return [tagger.tag(seq) for seq in seqs]
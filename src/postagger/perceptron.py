@@ -0,0 +1,179 @@
+import json
+import random
+from collections import defaultdict
+
+"""
+A greedy averaged perceptron POS tagger, after Matthew Honnibal's "A good POS tagger in about 200 lines of Python"
+(https://explosion.ai/blog/part-of-speech-pos-tagger-in-python). Each token is tagged left to right from
+features of its own form, its neighbours' forms and the tags already given to the two tokens before it.
+
+Tokens are those sent to YAP (see tag_heb_pos.prep_for_yap): unvowelled Hebrew letters, or '.' for everything
+that isn't Rabbinic Hebrew. The tags are YAP's, so the tagger can stand in for it.
+"""
+
+START = ['-START-', '-START2-']
+END = ['-END-', '-END2-']
+
+# A word is tagged from the tag dictionary alone if it was seen at least this often, with the same tag at least
+# this fraction of the time
+tagdict_min_count = 20
+tagdict_min_ratio = 0.97
+
+
+class AveragedPerceptron:
+
+    def __init__(self):
+        # feature -> {tag: weight}
+        self.weights = {}
+        self.classes = set()
+        # Running totals of each weight, and when each was last updated, for averaging at the end of training
+        self._totals = defaultdict(float)
+        self._timestamps = defaultdict(int)
+        self.i = 0
+
+    def predict(self, features):
+        scores = dict.fromkeys(self.classes, 0.0)
+        for feature in features:
+            weights = self.weights.get(feature)
+            if weights is None:
+                continue
+            for tag, weight in weights.items():
+                scores[tag] += weight
+        # Ties are broken by the tag's name, so that tagging is deterministic
+        return max(scores.items(), key=lambda item: (item[1], item[0]))[0]
+
+    def update(self, truth, guess, features):
+        self.i += 1
+        if truth == guess:
+            return
+        for feature in features:
+            weights = self.weights.setdefault(feature, {})
+            for tag, change in ((truth, 1.0), (guess, -1.0)):
+                weight = weights.get(tag, 0.0)
+                key = (feature, tag)
+                self._totals[key] += (self.i - self._timestamps[key]) * weight
+                self._timestamps[key] = self.i
+                weights[tag] = weight + change
+
+    def average_weights(self):
+        for feature, weights in self.weights.items():
+            averaged = {}
+            for tag, weight in weights.items():
+                key = (feature, tag)
+                total = self._totals[key] + (self.i - self._timestamps[key]) * weight
+                if total != 0:
+                    averaged[tag] = total / self.i
+            self.weights[feature] = averaged
+        self.weights = {feature: weights for feature, weights in self.weights.items() if len(weights) > 0}
+        self._totals = defaultdict(float)
+        self._timestamps = defaultdict(int)
+
+
+def normalize(token):
+    # YAP is sent '.' for an empty token (see yap.to_phrase)
+    return token if token != '' else '.'
+
+
+def features(i, word, context, prev, prev2):
+    """
+    :param i: the index of the word in context, which is padded with two START and two END tokens
+    :param prev: the tag of the word before
+    :param prev2: the tag of the word two before
+    """
+    return [
+        'bias',
+        'i word ' + word,
+        'i pref1 ' + word[:1],
+        'i pref2 ' + word[:2],
+        'i suff1 ' + word[-1:],
+        'i suff2 ' + word[-2:],
+        'i suff3 ' + word[-3:],
+        'i len ' + str(min(len(word), 8)),
+        'i-1 tag ' + prev,
+        'i-2 tag ' + prev2,
+        'i-1 tag+i-2 tag ' + prev + ' ' + prev2,
+        'i-1 tag+i word ' + prev + ' ' + word,
+        'i-1 word ' + context[i - 1],
+        'i-1 suff3 ' + context[i - 1][-3:],
+        'i-2 word ' + context[i - 2],
+        'i+1 word ' + context[i + 1],
+        'i+1 pref2 ' + context[i + 1][:2],
+        'i+1 suff3 ' + context[i + 1][-3:],
+        'i+2 word ' + context[i + 2],
+    ]
+
+
+class PerceptronTagger:
+
+    def __init__(self):
+        self.model = AveragedPerceptron()
+        self.tagdict = {}
+
+    def tag(self, seq):
+        """
+        :param seq: the tokens of a sequence, as given to yap.tag_all
+        :return: the POS of each token
+        """
+        words = [normalize(token) for token in seq]
+        context = START + words + END
+        prev, prev2 = START
+        tags = []
+        for i, word in enumerate(words):
+            tag = self.tagdict.get(word)
+            if tag is None:
+                tag = self.model.predict(features(i + 2, word, context, prev, prev2))
+            tags.append(tag)
+            prev2, prev = prev, tag
+        return tags
+
+    def train(self, sequences, tag_sequences, epochs=5, seed=0):
+        """
+        :param sequences: lists of tokens
+        :param tag_sequences: the POS of each token, as a list for each sequence
+        """
+        self._make_tagdict(sequences, tag_sequences)
+        for seq_tags in tag_sequences:
+            self.model.classes.update(seq_tags)
+        examples = list(zip(sequences, tag_sequences))
+        shuffle = random.Random(seed).shuffle
+        for epoch in range(epochs):
+            for seq, seq_tags in examples:
+                words = [normalize(token) for token in seq]
+                context = START + words + END
+                prev, prev2 = START
+                for i, (word, truth) in enumerate(zip(words, seq_tags)):
+                    guess = self.tagdict.get(word)
+                    if guess is None:
+                        word_features = features(i + 2, word, context, prev, prev2)
+                        guess = self.model.predict(word_features)
+                        self.model.update(truth, guess, word_features)
+                    prev2, prev = prev, guess
+            shuffle(examples)
+        self.model.average_weights()
+
+    def _make_tagdict(self, sequences, tag_sequences):
+        counts = defaultdict(lambda: defaultdict(int))
+        for seq, seq_tags in zip(sequences, tag_sequences):
+            for token, tag in zip(seq, seq_tags):
+                counts[normalize(token)][tag] += 1
+        self.tagdict = {}
+        for word, tag_counts in counts.items():
+            tag, mode = max(tag_counts.items(), key=lambda item: (item[1], item[0]))
+            total = sum(tag_counts.values())
+            if total >= tagdict_min_count and mode / total >= tagdict_min_ratio:
+                self.tagdict[word] = tag
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'classes': sorted(self.model.classes), 'tagdict': self.tagdict,
+                       'weights': self.model.weights}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            saved = json.load(f)
+        tagger = cls()
+        tagger.model.classes = set(saved['classes'])
+        tagger.model.weights = saved['weights']
+        tagger.tagdict = saved['tagdict']
+        return tagger
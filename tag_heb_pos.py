@@ -1,61 +1,23 @@
-import requests
+import argparse
 import os
 import json
+from utils import yap
+from utils import yapcache
+from src.postagger import hebrewtagger
 from utils.deconstruct import *
 from utils.rlprint import rlprint
 
 data_path = './data/lang_tagged_talmud/'
 output_path = './data/pos_tagged_talmud/'
 
-yap_host_address = 'http://localhost:8000/yap/heb/joint'
-
 
 def remove_aram_prefixes_from_start(word):
     return detach_prefixes(word, lang='A')
 
 
-def get_yap_tagging(heb_phrase):
-    data = '{{"text": "{}"}}'.format(heb_phrase).encode('utf-8')
-    yap_response = requests.get(yap_host_address, data=data, headers={'content-type': 'application/json'})
-    yap_json = json.loads(yap_response.text)
-    return yap_json
-
-
-def clean_yap_rval(yap_rval):
-    """
-    Returns list of (token, pos) tuples
-    """
-    token_info = yap_rval['md_lattice'].split('\n')
-    # info line is structured as:   INDEX   INDEX+1   TOKEN   REVISED_TOKEN   POS   POS   OTHER_INFO   ORIGINAL_INDEX
-    token_info = [info.split('\t') for info in token_info]
-
-    pos_list = []
-    curr = 1
-    for info in token_info:
-        if len(info) == 1:  # The table ends with empty strings
-            continue
-
-        pos = info[4]
-        index = info[-1]
-
-        # The final POS for the given index is the one that matters, since the preceding ones are prefixes
-        if curr == index:
-            pos_list[-1] = pos
-        else:
-            curr = index
-            pos_list.append(pos)
-
-    return pos_list
-
-
 def tag_heb_pos(seq):
-    heb_phrases = ' '.join(seq) + '  '
-    rlprint(heb_phrases)
-
-    tagged_heb_sequence = get_yap_tagging(heb_phrases)
-    heb_tags_only = clean_yap_rval(tagged_heb_sequence)
-
-    return heb_tags_only
+    rlprint(yap.to_phrase(seq))
+    return yap.tag_all([seq])[0]
 
 
 def prep_for_yap(chk_text):
@@ -74,11 +36,54 @@ def prep_for_yap(chk_text):
     return heb_words_only
 
 
+def plan_units(text):
+    """
+    Groups the chunks of a tractate into tagging units, each of which is sent to YAP once. A chunk that continues
+    onto the next page ('mc' or 'gc') is tagged together with the first chunk of the next page, if it ends in
+    Hebrew, so that YAP sees the whole phrase; a chain of such continuations across several pages makes a single
+    unit.
+
+    :return: the units, as lists of (page index, chunk index) in page order, and the words sent to YAP for each
+    """
+    units = []
+    sequences = []
+    continues = False
+    for page_index, page in enumerate(text):
+        for chunk_index, chunk in enumerate(page):
+            hebrew_words_only = prep_for_yap(chunk['text'])
+            if chunk_index == 0 and continues:
+                units[-1].append((page_index, chunk_index))
+                sequences[-1] += hebrew_words_only
+            else:
+                units.append([(page_index, chunk_index)])
+                sequences.append(hebrew_words_only)
+            continues = (chunk['type'] == 'mc' or chunk['type'] == 'gc') and len(hebrew_words_only) > 0 \
+                and hebrew_words_only[-1] != '.'
+    return units, sequences
+
+
 if __name__ == '__main__':
-    print('REMINDER: YAP must be running in order for this program to run.')
-    run = input('Is YAP running? y/n: ')
-    if run == 'n':
-        assert False
+    parser = argparse.ArgumentParser(description='Tags the POS of the Rabbinic Hebrew words with YAP.')
+    parser.add_argument('--tagger', default='yap', choices=('yap', 'embedded'),
+                        help='YAP, or the in-process tagger trained on its output by generate_POSTagger.py')
+    parser.add_argument('--yap', nargs='+', default=yap.endpoints,
+                        help='addresses of the YAP joint parsers, e.g. instances on several ports')
+    parser.add_argument('--batch-tokens', type=int, default=yap.batch_tokens,
+                        help='maximum number of tokens packed into one request')
+    parser.add_argument('--workers', type=int, default=yap.workers,
+                        help='maximum number of requests in flight (default: one per YAP server)')
+    parser.add_argument('--no-cache', action='store_true', help="don't read or save cached YAP lattices")
+    args = parser.parse_args()
+    yap.set_endpoints(args.yap)
+    yap.use_cache = not args.no_cache
+
+    if args.tagger == 'yap':
+        print('REMINDER: YAP must be running in order for this program to run.')
+        healthy = yap.check_health()
+        print('{} of {} YAP servers are up'.format(len(healthy), len(args.yap)))
+        run = input('Is YAP running? y/n: ')
+        if run == 'n':
+            assert False
 
     files = os.listdir(data_path)
 
@@ -88,57 +93,36 @@ if __name__ == '__main__':
         if do_masekhet == 'n':
             continue
 
-    with open(data_path + file, encoding='utf-8') as f:
-        text = json.load(f)
+        with open(data_path + file, encoding='utf-8') as f:
+            text = json.load(f)
 
-    text_with_pos_tags = []
-
-    continued = False
-    prev_chunk_text = []
-
-    for page in text:
-        print('-'*10 + 'next page' + '-'*10)
+        # Every unit is tagged once, all of them together, and the tags are written back to their chunks
+        units, sequences = plan_units(text)
+        if args.tagger == 'yap':
+            all_pos_tags = yap.tag_all(sequences, args.batch_tokens, args.workers)
+        else:
+            all_pos_tags = hebrewtagger.tag_all(sequences)
 
         # What will be written to the file -- just the chunks themselves with each word POS and language tagged
-        text_with_pos_tags.append([])
-
-        for chunk in page:
-            print('='*10)
-            chunk_text = chunk['text']
-
-            if not continued:
-                hebrew_words_only = prep_for_yap(chunk_text)
-            else:
-                hebrew_words_only = prep_for_yap(prev_chunk_text + chunk_text)
-            pos_tags = tag_heb_pos(hebrew_words_only)[::-1]
-
-            if continued:
-                prev_chunk_tagged = [{'lang': word_forms['lang'],
-                                      'word': word_forms['word'],
-                                      'pos': pos_tags.pop()} for word_forms in prev_chunk_text]
-                text_with_pos_tags[-2][-1] = prev_chunk_tagged
-
-                print('*'*10)
-                for w in prev_chunk_tagged:
+        text_with_pos_tags = [[None] * len(page) for page in text]
+        for unit, pos_tags in zip(units, all_pos_tags):
+            pos_tags = iter(pos_tags)
+            for page_index, chunk_index in unit:
+                text_with_pos_tags[page_index][chunk_index] = [{'lang': word_forms['lang'],
+                                                                'word': word_forms['word'],
+                                                                'pos': next(pos_tags)}
+                                                               for word_forms in text[page_index][chunk_index]['text']]
+
+        for page_tagged in text_with_pos_tags:
+            print('-'*10 + 'next page' + '-'*10)
+            for chunk_tagged in page_tagged:
+                print('='*10)
+                for w in chunk_tagged:
                     rlprint(w['word'][1], end='\t\t\t')
                     print(w['pos'])
-                print('*'*10)
-
-            curr_chunk_tagged = [{'lang': word_forms['lang'],
-                                  'word': word_forms['word'],
-                                  'pos': pos_tags.pop()} for word_forms in chunk_text]
-            text_with_pos_tags[-1].append(curr_chunk_tagged)
-
-            if not continued and (chunk['type'] == 'mc' or chunk['type'] == 'gc') and hebrew_words_only[-1] != '.':
-                prev_chunk_text = chunk_text
-                continued = True
-            else:
-                prev_chunk_text = []
-                continued = False
-
-            for w in curr_chunk_tagged:
-                rlprint(w['word'][1], end='\t\t\t')
-                print(w['pos'])
 
-    with open(output_path + file, 'w+', encoding='utf-8') as f:
-        json.dump(text_with_pos_tags, f, ensure_ascii=False, indent=4)
+        with open(output_path + file, 'w+', encoding='utf-8') as f:
+            json.dump(text_with_pos_tags, f, ensure_ascii=False, indent=4)
+        if args.tagger == 'yap':
+            print(yap.report())
+            print('YAP lattice cache: ' + yapcache.report())
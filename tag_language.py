@@ -1,6 +1,9 @@
 import os
 import json
-from src.languagetagger.gemaratagger import tag_gemara_chunk
+from concurrent.futures import ProcessPoolExecutor
+from src.languagetagger.gemaratagger import tag_gemara_chunks
+from src.languagetagger import probcache
+from src.languagetagger import relabel
 from src.languagetagger.identifiers import *
 from utils.rlprint import rlprint
 
@@ -8,8 +11,122 @@ base_path = './data/connected_talmud/'
 model_file = './src/pshat/PSHAT_final_model.model'
 out_path = './data/lang_tagged_talmud/'
 
+# Maximum number of Gemara words classified in one call to the language model
+window_size = 20000
+# Number of processes tagging pages in parallel
+workers = os.cpu_count()
+
 files = os.listdir(base_path)
 
+
+def forms_for_tagging(chunk_text):
+    # first we need to make sure that there exists a word in the Maleh word corpus corresponding
+    # to a Sefaria word, otherwise the word will be '' and will not be properly predicted
+    return [word_forms[1] if word_forms[1] != '' else word_forms[0] for word_forms in chunk_text]
+
+
+def is_mishna(chunk):
+    return chunk['type'] == 'm' or chunk['type'] == 'mc'
+
+
+def word_flags(word_for_tagging, word_forms, bible, mishna, tanna):
+    # Which of the chunk's sources the word is found in, for relabel.py
+    return (relabel.IN_BIBLE * is_in_bible(word_for_tagging, bible)
+            | relabel.IN_MISHNA * is_in_mishna(word_forms, mishna)
+            | relabel.IN_TANNA * is_in_tanna(word_forms, tanna))
+
+
+def tag_page(page, page_langs):
+    """
+    Tags the languages of one page, independently of the other pages (see stitch_pages).
+
+    :param page: a page of the connected Talmud
+    :param page_langs: the probability of each word being Hebrew, as a list for each Gemara chunk of the page
+    :return: the language-tagged chunks of the page, and the probabilities and source matches of its words (for
+             relabel.py)
+    """
+    page_langs = iter(page_langs)
+    page_tagged = []
+    probs, flags = [], []
+    for chunk in page['content']:
+        bible, mishna, tanna = chunk_indexes(chunk)
+        chunk_text = chunk['text']
+
+        words_for_tagging = forms_for_tagging(chunk_text)
+        flags += [word_flags(words_for_tagging[i], chunk_text[i], bible, mishna, tanna)
+                  for i in range(len(chunk_text))]
+
+        # Mishnas are either Rabbinic Hebrew or Biblical Hebrew
+        if is_mishna(chunk):
+            page_tagged.append({'type': chunk['type'],
+                                'text': [{'lang': ('B' if is_in_bible(words_for_tagging[i], bible) else 'R'),
+                                          'word': chunk_text[i]} for i in range(len(chunk_text))]})
+            probs += [float('nan')] * len(chunk_text)
+            continue
+
+        # Gemaras are more complex and need a language model to distinguish their languages
+        chunk_langs = next(page_langs)
+        probs += chunk_langs
+
+        # First, try tagging based solely on probabilities, leaving ambiguous words as unidentified
+        chunk_tagged = []
+        for i in range(len(chunk_text)):
+            # If the word is in the Bible or Mishna, its language is auto-tagged accordingly
+            if is_in_bible(words_for_tagging[i], bible):
+                chunk_tagged.append({'lang': 'B', 'word': chunk_text[i]})
+            elif is_in_mishna(chunk_text[i], mishna):
+                chunk_tagged.append({'lang': 'R', 'word': chunk_text[i]})
+            # Otherwise, base it on probabilities
+            elif chunk_langs[i] > relabel.upper:  # i.e. 80% or higher chance of being Hebrew
+                chunk_tagged.append({'lang': 'R', 'word': chunk_text[i]})
+            elif chunk_langs[i] < relabel.lower:  # i.e. 80% or higher chance of being Aramaic
+                chunk_tagged.append({'lang': 'A', 'word': chunk_text[i]})
+            else:
+                chunk_tagged.append({'lang': 'U', 'word': chunk_text[i]})
+
+        # Disambiguate words that were identified as 'U'
+        chunk_tagged = disambiguate_chunk(chunk_tagged, chunk_text, chunk_langs, tanna)
+
+        page_tagged.append({'type': chunk['type'], 'text': chunk_tagged})
+    return page_tagged, probs, flags
+
+
+def stitch_pages(lang_tagged, page_langs):
+    """
+    Checks Gemaras that continue across a page: if the last word on a page is unidentified, it is disambiguated
+    by its trigram with the first word of the next page. Goes through the chunks in order, with the same state
+    as when the pages were tagged one after the other.
+
+    :param lang_tagged: the tagged pages, modified in place
+    :param page_langs: the probabilities of the Gemara chunks of each page, as given to tag_page
+    """
+    # Nothing before the first chunk can be disambiguated (as in relabel.relabel)
+    last_words = [{'prob': 0, 'lang': 'B'},
+                  {'prob': 0, 'lang': 'B'}]
+    for page_index, (page_tagged, langs) in enumerate(zip(lang_tagged, page_langs)):
+        langs = iter(langs)
+        for chunk_index, chunk in enumerate(page_tagged):
+            if chunk['type'] == 'm' or chunk['type'] == 'mc':
+                continue
+            chunk_langs = next(langs)
+            chunk_tagged = chunk['text']
+
+            #                       == 0 means this is the first chunk on the page
+            if chunk['type'] == 'gc' and chunk_index == 0 and last_words[1]['lang'] == 'U':
+                next_prob = chunk_langs[0]
+                if is_valid_trigram(last_words[0], chunk_tagged[0]):
+                    last_word_lang = trigram_language_disambiguate(last_words[0]['prob'],
+                                                                   last_words[1]['prob'], next_prob)
+                    lang_tagged[page_index - 1][-1]['text'][-1]['lang'] = last_word_lang
+            # saves the word/lang/probability of the last two words of the last chunk on the page
+            elif chunk['type'] == 'gc' and len(chunk_tagged) >= 2:
+                last_words = [{'prob': chunk_langs[-2], 'lang': chunk_tagged[-2]['lang']},
+                              {'prob': chunk_langs[-1], 'lang': chunk_tagged[-1]['lang']}]
+            else:
+                last_words = [{'prob': 0, 'lang': 'B'},
+                              {'prob': 0, 'lang': 'B'}]
+
+
 if __name__ == '__main__':
     for file in files:
         title = file[:-5]
@@ -20,72 +137,40 @@ if __name__ == '__main__':
         with open(base_path + file, encoding='utf-8') as f:
             text = json.load(f)
 
-        lang_tagged = []
-        last_words = []
-        for page in text:
-            print('-'*20 + page['page'] + '-'*20)
-
-            lang_tagged.append([])
-            for chunk in page['content']:
-                bible = chunk['bible']
-                chunk_text = chunk['text']
+        # Classify every Gemara word of the tractate up front, in as few calls to the model as possible
+        gemara_chunks = [forms_for_tagging(chunk['text']) for page in text for chunk in page['content']
+                         if not is_mishna(chunk)]
+        gemara_langs = iter(tag_gemara_chunks(gemara_chunks, window_size))
+        probcache.save()
+        print('Language probability cache: ' + probcache.report())
+        page_langs = [[next(gemara_langs) for chunk in page['content'] if not is_mishna(chunk)] for page in text]
 
-                # first we need to make sure that there exists a word in the Maleh word corpus corresponding
-                # to a Sefaria word, otherwise the word will be '' and will not be properly predicted
-                words_for_tagging = [word_forms[1] if word_forms[1] != '' else word_forms[0]
-                                     for word_forms in chunk_text]
+        # The pages are tagged independently, in parallel, and then stitched together in order
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                tagged_pages = list(executor.map(tag_page, text, page_langs,
+                                                 chunksize=max(1, len(text) // (4 * workers))))
+        else:
+            tagged_pages = list(map(tag_page, text, page_langs))
+        lang_tagged = [page_tagged for page_tagged, _, _ in tagged_pages]
+        stitch_pages(lang_tagged, page_langs)
 
-                # Mishnas are either Rabbinic Hebrew or Biblical Hebrew
+        for page, page_tagged in zip(text, lang_tagged):
+            print('-'*20 + page['page'] + '-'*20)
+            for chunk in page_tagged:
                 if chunk['type'] == 'm' or chunk['type'] == 'mc':
-                    lang_tagged[-1].append({'type': chunk['type'],
-                                            'text': [{'lang': ('B' if words_for_tagging[i] in bible else 'R'),
-                                                      'word': chunk_text[i]} for i in range(len(chunk_text))]})
                     continue
-
-                # Gemaras are more complex and need a language model to distinguish their languages
-                chunk_langs = tag_gemara_chunk(words_for_tagging)
-
-                # First, try tagging based solely on probabilities, leaving ambiguous words as unidentified
-                chunk_tagged = []
-                for i in range(len(chunk_text)):
-                    # If the word is in the Bible or Mishna, its language is auto-tagged accordingly
-                    if words_for_tagging[i] in bible:
-                        chunk_tagged.append({'lang': 'B', 'word': chunk_text[i]})
-                    elif is_in_mishna(words_for_tagging[i]):
-                        chunk_tagged.append({'lang': 'R', 'word': chunk_text[i]})
-                    # Otherwise, base it on probabilities
-                    elif chunk_langs[i] > 0.8:  # i.e. 80% or higher chance of being Hebrew
-                        chunk_tagged.append({'lang': 'R', 'word': chunk_text[i]})
-                    elif chunk_langs[i] < 0.2:  # i.e. 80% or higher chance of being Aramaic
-                        chunk_tagged.append({'lang': 'A', 'word': chunk_text[i]})
-                    else:
-                        chunk_tagged.append({'lang': 'U', 'word': chunk_text[i]})
-
-                # Disambiguate words that were identified as 'U'
-                chunk_tagged = disambiguate_chunk(chunk_tagged, chunk_text, chunk_langs, chunk)
-
-                lang_tagged[-1].append({'type': chunk['type'], 'text': chunk_tagged})
-
-                # Lastly, we check gemaras that continue across a page to see if any of the last words on a page
-                #                                                 == 1 means this is the first chunk on the page
-                if chunk['type'] == 'gc' and len(lang_tagged[-1]) == 1 and last_words[1]['lang'] == 'U':
-                    next_prob = chunk_langs[0]
-                    if is_valid_trigram(last_words[0], chunk_tagged[0]):
-                        last_word_lang = trigram_language_disambiguate(last_words[0]['prob'],
-                                                                       last_words[1]['prob'], next_prob)
-                        lang_tagged[-2][-1]['text'][-1]['lang'] = last_word_lang
-                # saves the word/lang/probability of the last two words of the last chunk on the page
-                elif chunk['type'] == 'gc' and len(chunk_tagged) >= 2:
-                    last_words = [{'prob': chunk_langs[-2], 'lang': chunk_tagged[-2]['lang']},
-                                  {'prob': chunk_langs[-1], 'lang': chunk_tagged[-1]['lang']}]
-                else:
-                    last_words = [{'prob': 0, 'lang': 'B'},
-                                  {'prob': 0, 'lang': 'B'}]
-
-                for w in chunk_tagged:
+                for w in chunk['text']:
                     print(w['lang'], end='\t')
                     rlprint(w['word'][1])
 
         # write to output file, without inessential data (i.e. daf numbers, sources)
         with open(out_path + file, 'w+', encoding='utf-8') as f:
             json.dump(lang_tagged, f, ensure_ascii=False, indent=4)
+
+        # The probabilities and source matches of every word, so that the labels can be retuned offline
+        chunks = [chunk for page in text for chunk in page['content']]
+        relabel.save(title, [p for _, probs, _ in tagged_pages for p in probs],
+                     [flag for _, _, flags in tagged_pages for flag in flags],
+                     [len(chunk['text']) for chunk in chunks], [chunk['type'] for chunk in chunks],
+                     [page_index for page_index, page in enumerate(text) for _ in page['content']])
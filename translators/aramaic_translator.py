@@ -2,11 +2,19 @@ import json
 
 # downloaded from the Mongodb, only the dicta words and corresponding Jastrow RIDs
 path = './data/dicta_to_jastrow.json'
-with open(path, encoding='utf-8') as f:
-    dicta_mapping = json.load(f)
+_dicta_mapping = None
+
+
+def _get_dicta_mapping():
+    global _dicta_mapping
+    if _dicta_mapping is None:
+        with open(path, encoding='utf-8') as f:
+            _dicta_mapping = json.load(f)
+    return _dicta_mapping
 
 
 def translate(word):
+    dicta_mapping = _get_dicta_mapping()
     if word in dicta_mapping:
         # The Dicta database keys are HASER words
         return dicta_mapping[word['word'][2]]
@@ -2,11 +2,19 @@ import json
 
 # generated from database_formatters/bdb_jastrow_linker.py
 path = './data/bdb_to_jastrow.json'
-with open(path, encoding='utf-8') as f:
-    bdb_mapping = json.load(f)
+_bdb_mapping = None
+
+
+def _get_bdb_mapping():
+    global _bdb_mapping
+    if _bdb_mapping is None:
+        with open(path, encoding='utf-8') as f:
+            _bdb_mapping = json.load(f)
+    return _bdb_mapping
 
 
 def translate(word):
+    bdb_mapping = _get_bdb_mapping()
     if word in bdb_mapping:
         # The Bible translate uses MALEH spelling
         return bdb_mapping[word['word'][1]]
@@ -0,0 +1,183 @@
+from bisect import bisect_left
+from collections import Counter
+
+"""
+Automatic alignment of two word sequences (e.g. the Sefaria and Dicta versions of a tractate).
+
+Words are compared by precomputed keys (e.g. alph_only of each word). The sequences are first split on
+anchors -- keys occurring exactly once in both sides, kept in order (as in patience diff) -- and whatever
+is left between anchors is aligned with a banded edit distance, which resolves insertions and deletions
+without any human input.
+
+An alignment is a list of (i, j) pairs in order, where i indexes the first sequence and j the second;
+either one is None when the word has no counterpart on the other side.
+"""
+
+MATCH = 'match'         # keys are identical
+SUBSTITUTE = 'sub'      # aligned despite differing keys (the manual aligner's 'a')
+FIRST_ONLY = 'first'    # word only in the first sequence (the manual aligner's 's')
+SECOND_ONLY = 'second'  # word only in the second sequence (the manual aligner's 'd')
+
+
+def align_sequences(a, b, band=50):
+    """
+    Aligns two sequences of keys.
+
+    :param a: keys of the first sequence
+    :param b: keys of the second sequence
+    :param band: extra width of the edit distance band around the diagonal, for gaps without anchors
+    :return: list of (i, j) pairs covering every index of both sequences, in order
+    """
+    alignment = []
+    _align_range(a, b, 0, len(a), 0, len(b), alignment, band)
+    return alignment
+
+
+def op_type(a, b, pair):
+    i, j = pair
+    if j is None:
+        return FIRST_ONLY
+    if i is None:
+        return SECOND_ONLY
+    return MATCH if a[i] == b[j] else SUBSTITUTE
+
+
+def conflict_spans(a, b, alignment):
+    """
+    Groups the non-matching pairs of an alignment into maximal runs, dropping the runs that are confident
+    (see _is_confident).
+
+    :return: list of (start, end) slices of the alignment
+    """
+    spans = []
+    start = None
+    for k, pair in enumerate(alignment + [(None, None)]):
+        is_match = pair != (None, None) and op_type(a, b, pair) == MATCH
+        if pair == (None, None) or is_match:
+            if start is not None and not _is_confident(a, b, alignment[start:k]):
+                spans.append((start, k))
+            start = None
+        elif start is None:
+            start = k
+    return spans
+
+
+def _is_confident(a, b, span):
+    # A lone substitution whose keys only differ in their matres lectionis is a spelling variant
+    # (e.g. maleh vs. haser), not a misalignment
+    if len(span) != 1 or op_type(a, b, span[0]) != SUBSTITUTE:
+        return False
+    i, j = span[0]
+    return a[i].replace('ו', '').replace('י', '') == b[j].replace('ו', '').replace('י', '')
+
+
+def _align_range(a, b, a_lo, a_hi, b_lo, b_hi, out, band):
+    # Common prefix
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        out.append((a_lo, b_lo))
+        a_lo += 1
+        b_lo += 1
+
+    # Common suffix, added after everything else in the range
+    suffix = []
+    while a_hi > a_lo and b_hi > b_lo and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+        suffix.append((a_hi, b_hi))
+
+    anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+    if not anchors:
+        out.extend(_banded_alignment(a, b, a_lo, a_hi, b_lo, b_hi, band))
+    else:
+        for i, j in anchors:
+            _align_range(a, b, a_lo, i, b_lo, j, out, band)
+            out.append((i, j))
+            a_lo, b_lo = i + 1, j + 1
+        _align_range(a, b, a_lo, a_hi, b_lo, b_hi, out, band)
+
+    out.extend(reversed(suffix))
+
+
+def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    Finds the longest increasing run of keys that occur exactly once in both ranges.
+    """
+    a_counts = Counter(a[a_lo:a_hi])
+    b_counts = Counter(b[b_lo:b_hi])
+    b_position = {b[j]: j for j in range(b_lo, b_hi) if b_counts[b[j]] == 1}
+    candidates = [(i, b_position[a[i]]) for i in range(a_lo, a_hi)
+                  if a_counts[a[i]] == 1 and a[i] in b_position]
+    if not candidates:
+        return []
+
+    # Longest increasing subsequence of the second indices (patience sorting)
+    tails = []      # tails[k] = smallest second index ending an increasing run of length k + 1
+    tail_ids = []   # candidate index of each tail
+    back = []       # back[n] = candidate index preceding candidate n in its run
+    for n, (i, j) in enumerate(candidates):
+        k = bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_ids.append(n)
+        else:
+            tails[k] = j
+            tail_ids[k] = n
+        back.append(tail_ids[k - 1] if k > 0 else None)
+
+    anchors = []
+    n = tail_ids[-1]
+    while n is not None:
+        anchors.append(candidates[n])
+        n = back[n]
+    return anchors[::-1]
+
+
+def _banded_alignment(a, b, a_lo, a_hi, b_lo, b_hi, band):
+    """
+    Edit distance alignment of a[a_lo:a_hi] and b[b_lo:b_hi], restricted to a band around the diagonal.
+    Matches cost 0, substitutions and insertions/deletions cost 1.
+    """
+    n, m = a_hi - a_lo, b_hi - b_lo
+    if n == 0:
+        return [(None, b_lo + j) for j in range(m)]
+    if m == 0:
+        return [(a_lo + i, None) for i in range(n)]
+
+    width = abs(n - m) + band
+    inf = n + m + 1
+    # cost[i][j - i + width] = cost of aligning the first i words of a with the first j words of b
+    cost = [[inf] * (2 * width + 1) for _ in range(n + 1)]
+    move = [[''] * (2 * width + 1) for _ in range(n + 1)]
+    for i in range(n + 1):
+        for j in range(max(0, i - width), min(m, i + width) + 1):
+            d = j - i + width
+            if i == 0 and j == 0:
+                cost[i][d] = 0
+                continue
+            best, step = inf, ''
+            if i > 0 and j > 0:
+                diagonal = cost[i - 1][d] + (a[a_lo + i - 1] != b[b_lo + j - 1])
+                if diagonal < best:
+                    best, step = diagonal, 'diag'
+            if i > 0 and d + 1 <= 2 * width and cost[i - 1][d + 1] + 1 < best:
+                best, step = cost[i - 1][d + 1] + 1, 'up'
+            if j > 0 and d - 1 >= 0 and cost[i][d - 1] + 1 < best:
+                best, step = cost[i][d - 1] + 1, 'left'
+            cost[i][d] = best
+            move[i][d] = step
+
+    pairs = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        step = move[i][j - i + width]
+        if step == 'diag':
+            i -= 1
+            j -= 1
+            pairs.append((a_lo + i, b_lo + j))
+        elif step == 'up':
+            i -= 1
+            pairs.append((a_lo + i, None))
+        else:
+            j -= 1
+            pairs.append((None, b_lo + j))
+    return pairs[::-1]
@@ -1,9 +1,17 @@
 from utils import hebrew
-import pandas as pd
 
 prefix_table_path = './utils/prefix_table.csv'
-all_prefix_rules = pd.read_csv(prefix_table_path, encoding='utf-8')
-all_prefix_rules[['ARAM', 'HEB', 'ALL']].astype('int64')
+# Read on first use, so that importing this module doesn't import pandas
+_all_prefix_rules = None
+
+
+def _get_prefix_rules():
+    global _all_prefix_rules
+    if _all_prefix_rules is None:
+        import pandas as pd
+        _all_prefix_rules = pd.read_csv(prefix_table_path, encoding='utf-8')
+    return _all_prefix_rules
+
 
 all_verb_tags = ('VB', 'VBD', 'VBG', 'VBN', 'VBP', 'VBZ', 'MD', 'VB-M')
 all_noun_tags = ('NN', 'NNS', 'NNP', 'NNPS', 'NNG', 'NNGT', 'NNT')
@@ -71,6 +79,7 @@ def _is_in_order(pref, curr):
 
 
 def detach_prefixes(token, lang='U'):
+    all_prefix_rules = _get_prefix_rules()
     prefixes = all_prefix_rules[all_prefix_rules['ALL'] == 1 if lang == 'U'
                                 else (all_prefix_rules['ARAM'] == 1 if lang == 'A'
                                       else all_prefix_rules['HEB'] == 1)]
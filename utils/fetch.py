@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+"""
+A shared layer for all calls to the Sefaria API, with a content-addressed response cache on disk.
+
+Response bodies are stored once under objects/, named by the hash of their content; refs/ maps the hash of
+each URL to its body and the time it was fetched. The mode decides where responses come from:
+- 'cache' = serve cached responses (younger than ttl, if set), fetch and cache the rest
+- 'offline' = serve cached responses only, raising CacheMiss for anything else
+- 'record' = like 'cache', but also copies every response into the fixture store
+- 'replay' = serve the fixture store only, raising CacheMiss for anything else; a stand-in for sefaria.org
+             in benchmark and test runs
+The mode can be set with the TALMUD_FETCH_MODE environment variable or with set_mode, and ttl with the
+TALMUD_FETCH_TTL environment variable (in seconds). A single call can also ask for a fresher response than ttl
+with max_age; max_age=0 always goes to the network, except offline and in replay.
+
+Requests that do go to the network are rate limited by a token bucket shared by all threads, and retried
+with exponential backoff on connection errors, 429s and 5xx responses.
+"""
+
+cache_path = './data/http_cache/'
+fixture_path = './data/http_fixtures/'
+
+modes = ('cache', 'offline', 'record', 'replay')
+mode = os.environ.get('TALMUD_FETCH_MODE', 'cache')
+if mode not in modes:
+    # A typo must not quietly fall back to the network
+    raise ValueError('Unknown TALMUD_FETCH_MODE: ' + mode + ' (expected one of ' + ', '.join(modes) + ')')
+ttl = None  # In seconds; None means cached responses never expire
+if os.environ.get('TALMUD_FETCH_TTL'):
+    try:
+        ttl = float(os.environ['TALMUD_FETCH_TTL'])
+    except ValueError:
+        raise ValueError('TALMUD_FETCH_TTL must be a number of seconds, not ' + os.environ['TALMUD_FETCH_TTL'])
+
+timeout = 60
+retries = 4
+backoff = 1.0   # Seconds before the first retry; doubled for each further retry
+
+
+class CacheMiss(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity requests, refilled at rate requests per second.
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+limiter = TokenBucket(rate=10)
+
+
+def set_rate(rate, capacity=None):
+    global limiter
+    limiter = TokenBucket(rate, capacity)
+
+
+def set_mode(new_mode, new_ttl=None):
+    global mode, ttl
+    if new_mode not in modes:
+        raise ValueError('Unknown fetch mode: ' + new_mode)
+    mode = new_mode
+    ttl = new_ttl
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _write_atomically(file_path, content):
+    # Writing to a temporary file first means a reader never sees a half-written file
+    tmp_path = file_path + '.' + str(os.getpid()) + '.' + str(time.monotonic_ns()) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+
+
+def load(store, url, max_age=None):
+    """
+    :return: the stored body of the url, or None if it is missing or at least max_age seconds old
+    """
+    ref_file = os.path.join(store, 'refs', _url_key(url) + '.json')
+    try:
+        with open(ref_file, encoding='utf-8') as f:
+            ref = json.load(f)
+        if max_age is not None and time.time() - ref['time'] >= max_age:
+            return None
+        with open(os.path.join(store, 'objects', ref['object']), 'rb') as f:
+            return f.read()
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save(store, url, body):
+    object_key = hashlib.sha256(body).hexdigest()
+    os.makedirs(os.path.join(store, 'objects'), exist_ok=True)
+    os.makedirs(os.path.join(store, 'refs'), exist_ok=True)
+
+    object_file = os.path.join(store, 'objects', object_key)
+    if not os.path.exists(object_file):
+        _write_atomically(object_file, body)
+    ref = {'url': url, 'object': object_key, 'time': time.time()}
+    _write_atomically(os.path.join(store, 'refs', _url_key(url) + '.json'), json.dumps(ref).encode('utf-8'))
+
+
+def fetch(url, max_age=None):
+    """
+    :param max_age: if given, cached responses at least this many seconds old are fetched again, instead of
+                    those older than ttl (0 = always fetch)
+    :return: the body of the response to a GET request of the url, according to the current mode
+    """
+    if mode == 'replay':
+        body = load(fixture_path, url)
+        if body is None:
+            raise CacheMiss('No recorded response for ' + url)
+        return body
+
+    if mode == 'offline':
+        max_age = None
+    elif max_age is None:
+        max_age = ttl
+    body = load(cache_path, url, max_age)
+    if body is None:
+        if mode == 'offline':
+            raise CacheMiss('No cached response for ' + url)
+        body = _request(url)
+        save(cache_path, url, body)
+
+    if mode == 'record':
+        save(fixture_path, url, body)
+    return body
+
+
+def _request(url):
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            response = requests.get(url, timeout=timeout)
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response.content
+            error = requests.HTTPError(str(response.status_code) + ' response for ' + url, response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if attempt == retries:
+            raise error
+        # Jitter keeps the threads from retrying in lockstep
+        time.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+def get_json(url, max_age=None):
+    return json.loads(fetch(url, max_age).decode('utf-8'))
+
+
+def get_all_json(urls, workers=8):
+    """
+    Fetches many urls concurrently, with at most workers requests in flight.
+
+    :return: the decoded responses, in the order of urls
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(get_json, urls))
@@ -0,0 +1,136 @@
+import json
+import os
+from bisect import bisect_left
+
+"""
+A store of the cleaned texts of the sources linked from the Talmud (verses, mishnayot, etc.), keyed by their
+Sefaria ref. Each text is cleaned and stored once, however many chunks link to it; the chunks of the
+connected Talmud only hold the refs.
+
+Also gives access to the source corpora prefetched by scripts/prefetch_sources.py.
+"""
+
+store_path = './data/source_texts.json'
+
+_store = None
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        _store = {}
+        if os.path.exists(store_path):
+            with open(store_path, encoding='utf-8') as f:
+                _store = json.load(f)
+    return _store
+
+
+def has_source(ref):
+    return ref in _get_store()
+
+
+def add_source(ref, text):
+    _get_store()[ref] = text
+
+
+def source_text(ref):
+    return _get_store()[ref]
+
+
+def save_store():
+    tmp_path = store_path + '.tmp'
+    with open(tmp_path, 'w+', encoding='utf-8') as f:
+        json.dump(_get_store(), f, ensure_ascii=False, indent=0)
+    os.replace(tmp_path, store_path)
+
+
+def chunk_sources(chunk, category):
+    """
+    :param chunk: a chunk of the connected Talmud
+    :param category: 'bible', 'mishna', 'tosefta', 'sifra' or 'sifrei'
+    :return: the cleaned texts of the chunk's sources of that category, joined by spaces
+    """
+    sources = chunk[category]
+    # Chunks connected before the store existed hold the texts themselves
+    if type(sources) == str:
+        return sources
+    return ' '.join(source_text(ref) for ref in sources)
+
+
+# The corpora of the sources (Tanakh, Mishnah, Tosefta, Sifra, Sifrei), prefetched by scripts/prefetch_sources.py.
+# Each text is stored as a jagged array of its raw Hebrew segments, with an index from its title (e.g. 'Genesis'
+# or 'Sifra, Vayikra Dibbura DeNedavah') to its category and file, so that the text of any ref can be looked up
+# without the Sefaria API.
+corpus_path = './data/source_corpus/'
+
+_corpus_index = None
+_corpus_segments = {}
+
+
+def corpus_index():
+    global _corpus_index
+    if _corpus_index is None:
+        _corpus_index = {}
+        if os.path.exists(corpus_path + 'index.json'):
+            with open(corpus_path + 'index.json', encoding='utf-8') as f:
+                _corpus_index = json.load(f)
+    return _corpus_index
+
+
+def is_prefetched():
+    return len(corpus_index()) > 0
+
+
+def corpus_text(title):
+    """
+    :return: the jagged array of the raw Hebrew segments of the text with the given title
+    """
+    with open(corpus_path + corpus_index()[title]['file'], encoding='utf-8') as f:
+        return json.load(f)['he']
+
+
+def flatten(he):
+    """
+    :return: list of (address, segment) of a jagged array, addresses being tuples of 1-based indices
+    """
+    if type(he) == str:
+        return [((), he)]
+    return [((i + 1,) + address, segment) for i in range(len(he)) for address, segment in flatten(he[i])]
+
+
+def _segments(title):
+    """
+    :return: the addresses of the segments of a text, in order, and the segments themselves
+    """
+    if title not in _corpus_segments:
+        flat = flatten(corpus_text(title))
+        _corpus_segments[title] = ([address for address, _ in flat], [segment for _, segment in flat])
+    return _corpus_segments[title]
+
+
+def corpus_ref_text(ref):
+    """
+    Looks up the segments of a ref, e.g. 'Genesis 1:1', 'Mishnah Berakhot 2:3-5' or 'Exodus 12:49-13:2'.
+
+    :return: the list of raw Hebrew segments covered by the ref, or None if it is not in the corpus
+    """
+    title = max((t for t in corpus_index() if ref == t or ref.startswith(t + ' ')), key=len, default=None)
+    if title is None:
+        return None
+    address = ref[len(title):].strip()
+    addresses, segments = _segments(title)
+    if address == '':
+        return segments
+
+    try:
+        start, _, end = address.partition('-')
+        start = tuple(int(i) for i in start.split(':'))
+        end = tuple(int(i) for i in end.split(':')) if end != '' else start
+    except ValueError:  # Not a numeric address
+        return None
+    # 'Genesis 1:3-5' means 1:3-1:5
+    end = start[:len(start) - len(end)] + end
+
+    # A shorter address covers every segment under it
+    covered = segments[bisect_left(addresses, start):bisect_left(addresses, end[:-1] + (end[-1] + 1,))]
+    return covered if covered else None
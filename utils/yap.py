@@ -0,0 +1,303 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from utils import yapcache
+
+"""
+A client for the YAP morpho-syntactic parser (https://github.com/OnlpLab/yap), run as a server with `yap api`.
+
+Each thread keeps one requests.Session, so its connections to YAP stay open between requests. Many sequences
+(e.g. chunks) are packed into one request, each as a sentence of its own, since YAP ends a sentence at a double
+space; the md_lattice of the response has a block of lines for each sentence, which is split back out per
+sequence. Optionally, several requests are kept in flight at once, so that YAP is never waiting on HTTP.
+
+Since a YAP server parses on one core, the requests can be spread over several servers (e.g. local instances on
+different ports; see set_endpoints). Each request goes to the healthy server with the fewest requests in flight.
+A server that fails a request is marked down and the request is retried on another one; a server that is down
+gets a request again after recheck_interval seconds, and is marked up if it answers. If every server is down,
+the request waits (retry_delay seconds at first, doubled each time) and is retried on the server that failed
+longest ago, until it is answered or max_wait seconds have passed.
+
+The lattice of each sequence is cached on disk by utils/yapcache.py, so only new sequences are sent to YAP.
+"""
+
+endpoints = ['http://localhost:8000/yap/heb/joint']
+timeout = 600
+# Seconds before a server that failed is tried again
+recheck_interval = 30
+# Seconds a server has to answer a health check
+health_timeout = 30
+# Seconds a request waits before it is retried when every server is down, doubled for each further retry
+retry_delay = 1
+# Seconds a request waits in all for a server to come back up before YapUnavailable is raised
+max_wait = 300
+
+# Maximum number of tokens packed into one request
+batch_tokens = 2000
+# Maximum number of requests in flight; None means one per server
+workers = None
+# Whether lattices are read from and saved to yapcache
+use_cache = True
+
+_local = threading.local()
+_lock = threading.Lock()
+_in_flight = {}
+_down_since = {}
+_stats = {}
+
+
+class YapUnavailable(Exception):
+    pass
+
+
+def set_endpoints(addresses):
+    global endpoints
+    with _lock:
+        endpoints = list(addresses)
+        _in_flight.clear()
+        _down_since.clear()
+
+
+def _get_session():
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _acquire(tried, force=False):
+    """
+    :param tried: servers that already failed this request
+    :param force: if no server is up or due to be tried again, take the one that failed longest ago anyway
+    :return: the server with the fewest requests in flight, among those that are up or due to be tried again
+    """
+    now = time.monotonic()
+    with _lock:
+        candidates = [address for address in endpoints if address not in tried
+                      and now - _down_since.get(address, -recheck_interval) >= recheck_interval]
+        if len(candidates) == 0 and force and len(endpoints) > 0:
+            candidates = [min(endpoints, key=lambda a: _down_since.get(a, -recheck_interval))]
+        if len(candidates) == 0:
+            return None
+        address = min(candidates, key=lambda a: _in_flight.get(a, 0))
+        _in_flight[address] = _in_flight.get(address, 0) + 1
+        return address
+
+
+def _until_recheck():
+    # Seconds until the first server that is down is due to be tried again
+    now = time.monotonic()
+    with _lock:
+        if len(_down_since) == 0:
+            return 0
+        return max(0, min(_down_since.values()) + recheck_interval - now)
+
+
+def _release(address, failed):
+    with _lock:
+        _in_flight[address] -= 1
+        stats = _stats.setdefault(address, {'requests': 0, 'failures': 0})
+        stats['requests'] += 1
+        if failed:
+            stats['failures'] += 1
+            _down_since[address] = time.monotonic()
+        else:
+            _down_since.pop(address, None)
+
+
+def _send(address, phrase, request_timeout):
+    data = json.dumps({'text': phrase}, ensure_ascii=False).encode('utf-8')
+    response = _get_session().get(address, data=data, headers={'content-type': 'application/json'},
+                                  timeout=request_timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def parse(phrase):
+    """
+    :param phrase: tokens separated by spaces, each sentence followed by a double space
+    :return: YAP's response, from the least loaded server that answers
+    """
+    tried = set()
+    error = None
+    delay = retry_delay
+    deadline = time.monotonic() + max_wait
+    while True:
+        address = _acquire(tried)
+        if address is None:
+            # Every server is down or already failed this request, so wait a while and try again
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise YapUnavailable('No YAP server answered within {} s'.format(max_wait)
+                                     + (': ' + str(error) if error is not None else ''))
+            time.sleep(min(delay, remaining, _until_recheck()))
+            delay *= 2
+            address = _acquire(set(), force=True)
+            if address is None:
+                raise YapUnavailable('No YAP servers are configured')
+        tried.add(address)
+        try:
+            result = _send(address, phrase, timeout)
+        except (requests.RequestException, ValueError) as e:
+            _release(address, failed=True)
+            error = e
+            continue
+        _release(address, failed=False)
+        return result
+
+
+def check_health():
+    """
+    Sends a one-token request to every server, and marks them up or down accordingly.
+
+    :return: the addresses of the servers that answered
+    """
+    healthy = []
+    for address in endpoints:
+        try:
+            _send(address, '.  ', health_timeout)
+            up = True
+        except requests.HTTPError as e:
+            # The server answered, if only to refuse the request
+            up = e.response is not None and e.response.status_code < 500
+        except (requests.RequestException, ValueError):
+            up = False
+        with _lock:
+            if up:
+                _down_since.pop(address, None)
+            else:
+                _down_since[address] = time.monotonic()
+        if up:
+            healthy.append(address)
+    return healthy
+
+
+def report():
+    lines = []
+    with _lock:
+        for address in endpoints:
+            stats = _stats.get(address, {'requests': 0, 'failures': 0})
+            lines.append('{}: {} requests, {} failed{}'.format(address, stats['requests'], stats['failures'],
+                                                               ' (down)' if address in _down_since else ''))
+    return '\n'.join(lines)
+
+
+def to_phrase(seq):
+    # An empty token would make a double space, i.e. end the sentence, so it is sent as punctuation instead
+    return ' '.join(token if token != '' else '.' for token in seq) + '  '
+
+
+def lattice_pos(lines):
+    """
+    :param lines: the lines of a sentence's md_lattice, split into fields
+    :return: the POS of each token of the sentence
+    """
+    # info line is structured as:   INDEX   INDEX+1   TOKEN   REVISED_TOKEN   POS   POS   OTHER_INFO   ORIGINAL_INDEX
+    pos_list = []
+    curr = None
+    for info in lines:
+        pos = info[4]
+        index = info[-1]
+
+        # The final POS for the given index is the one that matters, since the preceding ones are prefixes
+        if curr == index:
+            pos_list[-1] = pos
+        else:
+            curr = index
+            pos_list.append(pos)
+    return pos_list
+
+
+def split_lattice(md_lattice):
+    """
+    :return: the lines of each sentence of an md_lattice, split into fields
+    """
+    sentences = [[]]
+    for line in md_lattice.split('\n'):
+        info = line.split('\t')
+        if len(info) == 1:  # Sentences are separated by empty lines
+            if len(sentences[-1]) > 0:
+                sentences.append([])
+            continue
+        sentences[-1].append(info)
+    return [sentence for sentence in sentences if len(sentence) > 0]
+
+
+def join_lattice(sentences):
+    # The inverse of split_lattice
+    return ''.join('\n'.join('\t'.join(info) for info in lines) + '\n\n' for lines in sentences)
+
+
+def sequence_pos(md_lattice):
+    """
+    :return: the POS of each token of a sequence, given its md_lattice
+    """
+    return [pos for lines in split_lattice(md_lattice) for pos in lattice_pos(lines)]
+
+
+def parse_batch(seqs):
+    """
+    Parses non-empty sequences of tokens in one request, and caches their lattices if use_cache.
+
+    :return: the md_lattice of each sequence
+    """
+    response = parse(''.join(to_phrase(seq) for seq in seqs))
+    sentences = split_lattice(response['md_lattice'])
+    if len(seqs) == 1:
+        # Everything YAP returned belongs to this sequence
+        lattices = [join_lattice(sentences)]
+    elif len(sentences) != len(seqs) or any(len(lattice_pos(lines)) != len(seq)
+                                            for lines, seq in zip(sentences, seqs)):
+        # YAP didn't split the batch where expected, so each sequence is parsed on its own
+        return [parse_batch([seq])[0] for seq in seqs]
+    else:
+        lattices = [join_lattice([lines]) for lines in sentences]
+    if use_cache:
+        for seq, lattice in zip(seqs, lattices):
+            yapcache.save(to_phrase(seq), lattice)
+    return lattices
+
+
+def batches(seqs, max_tokens):
+    """
+    :return: lists of the indices of consecutive non-empty sequences, with at most max_tokens tokens in each
+             (unless a sequence is longer by itself)
+    """
+    batch, size = [], 0
+    for i, seq in enumerate(seqs):
+        if len(seq) == 0:
+            continue
+        if len(batch) > 0 and size + len(seq) > max_tokens:
+            yield batch
+            batch, size = [], 0
+        batch.append(i)
+        size += len(seq)
+    if len(batch) > 0:
+        yield batch
+
+
+def tag_all(seqs, max_tokens=None, max_workers=None):
+    """
+    Tags many sequences of tokens. Those whose lattices aren't cached are packed into as few requests as the
+    batch size allows, with at most max_workers requests in flight.
+
+    :return: the POS of each token, as a list for each sequence, in the order of seqs
+    """
+    max_tokens = max_tokens or batch_tokens
+    max_workers = max_workers or workers or len(endpoints)
+    lattices = [(yapcache.load(to_phrase(seq)) if use_cache else None) if len(seq) > 0 else '' for seq in seqs]
+
+    uncached = [i for i in range(len(seqs)) if lattices[i] is None]
+    index_batches = [[uncached[i] for i in batch] for batch in batches([seqs[i] for i in uncached], max_tokens)]
+    seq_batches = [[seqs[i] for i in batch] for batch in index_batches]
+    if max_workers > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(parse_batch, seq_batches))
+    else:
+        parsed = [parse_batch(batch) for batch in seq_batches]
+
+    for batch, batch_lattices in zip(index_batches, parsed):
+        for i, lattice in zip(batch, batch_lattices):
+            lattices[i] = lattice
+    return [sequence_pos(lattice) for lattice in lattices]
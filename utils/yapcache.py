@@ -0,0 +1,79 @@
+import hashlib
+import os
+import threading
+import time
+
+"""
+A cache of YAP's md_lattice for each phrase sent to it (one sentence, as made by yap.to_phrase), shared by all
+tractates and runs. Most chunks don't change between runs of tag_heb_pos.py, so they don't need to be parsed
+again.
+
+Each lattice is a file named after the hash of its exact phrase, under a directory named after the first two
+characters of the hash.
+"""
+
+cache_path = './data/yap_cache/'
+
+hits = 0
+misses = 0
+_lock = threading.Lock()
+
+
+def phrase_key(phrase):
+    return hashlib.sha256(phrase.encode('utf-8')).hexdigest()
+
+
+def _lattice_file(phrase):
+    key = phrase_key(phrase)
+    return os.path.join(cache_path, key[:2], key)
+
+
+def load(phrase):
+    """
+    :return: the cached md_lattice of the phrase, or None
+    """
+    global hits, misses
+    try:
+        with open(_lattice_file(phrase), encoding='utf-8') as f:
+            lattice = f.read()
+    except OSError:
+        lattice = None
+    with _lock:
+        if lattice is None:
+            misses += 1
+        else:
+            hits += 1
+    return lattice
+
+
+def save(phrase, lattice):
+    lattice_file = _lattice_file(phrase)
+    os.makedirs(os.path.dirname(lattice_file), exist_ok=True)
+    # Writing to a temporary file first means a reader never sees a half-written file
+    tmp_path = lattice_file + '.' + str(os.getpid()) + '.' + str(time.monotonic_ns()) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(lattice)
+    os.replace(tmp_path, lattice_file)
+
+
+def size():
+    """
+    :return: the number of cached lattices and their total size in bytes
+    """
+    count, total = 0, 0
+    if not os.path.exists(cache_path):
+        return count, total
+    for directory in os.listdir(cache_path):
+        for file in os.listdir(os.path.join(cache_path, directory)):
+            if not file.endswith('.tmp'):
+                count += 1
+                total += os.path.getsize(os.path.join(cache_path, directory, file))
+    return count, total
+
+
+def report():
+    total = hits + misses
+    rate = hits / total if total > 0 else 0
+    count, total_bytes = size()
+    return '{} lookups, {} hits, {} parsed by YAP ({:.1%} hit rate), {} lattices cached ({:.1f} MB)'.format(
+        total, hits, misses, rate, count, total_bytes / 2 ** 20)